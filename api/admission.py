@@ -0,0 +1,187 @@
+"""Admission Control.
+
+This module bounds the number of concurrent calls to twitter api.
+A call runs immediately if a slot is free, otherwise it waits in a bounded
+    priority queue for at most ``queue_timeout`` seconds.
+When the queue is full the lowest priority waiter is shed (or the new call
+    if nothing waits with a lower priority) so bursts fail fast with
+    api.admission.Overloaded instead of slowing down every request.
+
+    Example usage:
+        >>> from api.admission import BATCH, controller
+        >>> with controller.admit(BATCH):
+        ...     <call twitter api>
+        >>> controller.metrics()
+
+"""
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# priorities, a lower value is admitted first
+INTERACTIVE = 0
+BATCH = 1
+BACKGROUND = 2
+
+
+class Overloaded(Exception):
+    """A Python class which inherit from Exception used to fire exception when a call is shed."""
+
+    def __init__(self, message, retry_after, *args):
+        """Instantiate a new api.admission.Overloaded object.
+
+        Args:
+          message (str):
+            the reason of shedding the call.
+
+          retry_after (int):
+            number of seconds the client should wait before retrying.
+
+          *args (iteable): arguments passed to the base class.
+
+        """
+        self.message = message
+        self.retry_after = retry_after
+        super(Overloaded, self).__init__(message, retry_after, *args)
+
+    def __str__(self):
+        """Representation of the error."""
+        return self.message
+
+
+class _Waiter:
+    """A call waiting for a free slot."""
+
+    __slots__ = ("event", "admitted", "shed")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.admitted = False
+        self.shed = False
+
+
+class AdmissionController:
+    """A concurrency limiter with a bounded, prioritized and deadline aware wait queue."""
+
+    def __init__(self, max_concurrency, max_queue, queue_timeout, retry_after=1):
+        """Instantiate a new api.admission.AdmissionController object.
+
+        Args:
+          max_concurrency (int):
+            maximum number of calls running at the same time.
+          max_queue (int):
+            maximum number of calls waiting for a slot.
+          queue_timeout (float):
+            maximum number of seconds a call waits for a slot.
+          retry_after (int, optional):
+            the Retry-After seconds sent to the shed clients, Defaults to 1.
+
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "preempted": 0, "timeout": 0}
+        self._waiters = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _shed(self, reason):
+        """Count a shed call and return the exception to raise, must be called with the lock held."""
+        self.shed[reason] += 1
+        return Overloaded("Too many requests to twitter api, please retry later.", self.retry_after)
+
+    def acquire(self, priority=INTERACTIVE):
+        """Wait for a free slot.
+
+        Args:
+            priority (int, optional):
+                the call priority, Defaults to INTERACTIVE.
+
+        Raises:
+            Overloaded: if the call is shed.
+
+        """
+        with self._lock:
+            if self.in_flight < self.max_concurrency and not self._waiters:
+                self.in_flight += 1
+                self.admitted += 1
+                return
+            if len(self._waiters) >= self.max_queue:
+                lowest = max(self._waiters) if self._waiters else None
+                if lowest is None or lowest[0] <= priority:
+                    raise self._shed("queue_full")
+                self._waiters.remove(lowest)
+                heapq.heapify(self._waiters)
+                lowest[2].shed = True
+                lowest[2].event.set()
+            entry = (priority, next(self._counter), _Waiter())
+            heapq.heappush(self._waiters, entry)
+        waiter = entry[2]
+        waiter.event.wait(self.queue_timeout)
+        with self._lock:
+            if waiter.admitted:
+                return
+            if waiter.shed:
+                raise self._shed("preempted")
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            raise self._shed("timeout")
+
+    def release(self):
+        """Free a slot handing it over to the highest priority waiter if any."""
+        with self._lock:
+            if self._waiters:
+                waiter = heapq.heappop(self._waiters)[2]
+                waiter.admitted = True
+                self.admitted += 1
+                waiter.event.set()
+            else:
+                self.in_flight -= 1
+
+    @contextmanager
+    def admit(self, priority=INTERACTIVE):
+        """Context manager which holds a slot while the block runs.
+
+        Args:
+            priority (int, optional):
+                the call priority, Defaults to INTERACTIVE.
+
+        Raises:
+            Overloaded: if the call is shed.
+
+        """
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def metrics(self):
+        """Get the admission control metrics.
+
+        Returns:
+            dict of the current queue depth, in flight calls and the admitted/shed counters.
+
+        """
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._waiters),
+                "admitted": self.admitted,
+                "shed": dict(self.shed),
+                "shed_total": sum(self.shed.values()),
+            }
+
+
+controller = AdmissionController(settings.TWITTER_MAX_CONCURRENCY,
+                                 settings.TWITTER_MAX_QUEUE,
+                                 settings.TWITTER_QUEUE_TIMEOUT,
+                                 settings.TWITTER_RETRY_AFTER)
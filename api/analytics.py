@@ -0,0 +1,145 @@
+"""Hashtag Analytics.
+
+This module computes engagement statistics over a batch of tweets.
+The tweets are converted once to columnar NumPy arrays and every metric
+    is computed with vectorized operations on these arrays.
+
+    Example usage:
+        >>> from api.analytics import TweetColumns, hashtag_analytics
+        >>> columns = TweetColumns(<list_of_api.twitter.Tweet>)
+        >>> columns.likes.mean()
+        >>> hashtag_analytics(<list_of_api.twitter.Tweet>, "#nyc")
+
+"""
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+SECONDS_PER_HOUR = 3600
+
+
+class TweetColumns:
+    """Columnar representation of a list of tweets.
+
+    Attributes:
+        likes (numpy.ndarray): likes count of each tweet.
+        retweets (numpy.ndarray): retweets count of each tweet.
+        timestamps (numpy.ndarray): creation time of each tweet as unix timestamp.
+        hashtags (numpy.ndarray): lower cased hashtags of all the tweets flattened.
+
+    """
+
+    def __init__(self, tweets):
+        """Instantiate a new api.analytics.TweetColumns object.
+
+        Args:
+          tweets (list):
+            list of api.twitter.Tweet.
+
+        """
+        count = len(tweets)
+        self.likes = np.fromiter((tweet.likes for tweet in tweets), dtype=np.int64, count=count)
+        self.retweets = np.fromiter((tweet.retweets for tweet in tweets), dtype=np.int64, count=count)
+        self.timestamps = np.fromiter((tweet.timestamp for tweet in tweets), dtype=np.int64, count=count)
+        self.hashtags = np.array([tag.lower() for tweet in tweets for tag in tweet.hashtags], dtype=str)
+
+    def __len__(self):
+        """Number of tweets."""
+        return len(self.likes)
+
+
+def summarize(values, percentiles=PERCENTILES):
+    """Compute the mean, max and percentiles of the given values.
+
+    Args:
+        values (numpy.ndarray):
+            integer values.
+        percentiles (iterable, optional):
+            percentiles to compute, Defaults to (50, 90, 99).
+
+    Returns:
+        dict of statistics, all values are None if ``values`` is empty.
+
+    """
+    keys = ["p%d" % q for q in percentiles]
+    if not len(values):
+        return dict.fromkeys(["mean", "max"] + keys)
+    stats = {"mean": float(values.mean()), "max": int(values.max())}
+    stats.update(zip(keys, np.percentile(values, percentiles).tolist()))
+    return stats
+
+
+def top_hashtags(hashtags, exclude=(), top=10):
+    """Find the most frequent hashtags.
+
+    Args:
+        hashtags (numpy.ndarray):
+            lower cased hashtags.
+        exclude (iterable, optional):
+            hashtags to ignore like the queried one.
+        top (int, optional):
+            maximum number of hashtags to return, Defaults to 10.
+
+    Returns:
+        list of {"hashtag", "count"} ordered by count desc.
+
+    """
+    if not len(hashtags):
+        return []
+    tags, counts = np.unique(hashtags, return_counts=True)
+    keep = ~np.isin(tags, [tag.lower() for tag in exclude])
+    tags, counts = tags[keep], counts[keep]
+    # stable sort keeps ties in alphabetical order
+    order = np.argsort(-counts, kind="stable")[:top]
+    return [{"hashtag": tag, "count": count}
+            for tag, count in zip(tags[order].tolist(), counts[order].tolist())]
+
+
+def posting_rate(timestamps):
+    """Compute the number of tweets posted per hour.
+
+    Args:
+        timestamps (numpy.ndarray):
+            unix timestamps of the tweets.
+
+    Returns:
+        dict with the average ``tweets_per_hour`` over the covered period and
+            the tweets ``count`` of each ``hour`` bucket ordered by hour.
+
+    """
+    if not len(timestamps):
+        return {"tweets_per_hour": None, "hours": []}
+    hours, counts = np.unique(timestamps // SECONDS_PER_HOUR, return_counts=True)
+    span = (hours[-1] - hours[0]) + 1
+    buckets = (hours * SECONDS_PER_HOUR).astype("datetime64[s]")
+    return {
+        "tweets_per_hour": float(len(timestamps) / span),
+        "hours": [{"hour": "%sZ" % hour, "count": count}
+                  for hour, count in zip(buckets.astype(str).tolist(), counts.tolist())],
+    }
+
+
+def hashtag_analytics(tweets, hashtag, top=10):
+    """Compute the engagement statistics of a hashtag tweets.
+
+    Args:
+        tweets (list):
+            list of api.twitter.Tweet.
+        hashtag (str):
+            the queried hashtag, excluded from the co-occurring hashtags.
+        top (int, optional):
+            number of co-occurring hashtags to return, Defaults to 10.
+
+    Returns:
+        dict of the hashtag statistics.
+
+    """
+    columns = TweetColumns(tweets)
+    tag = hashtag if hashtag.startswith("#") else "#%s" % hashtag
+    return {
+        "hashtag": hashtag,
+        "count": len(columns),
+        "likes": summarize(columns.likes),
+        "retweets": summarize(columns.retweets),
+        "top_hashtags": top_hashtags(columns.hashtags, exclude=[tag], top=top),
+        "posting_rate": posting_rate(columns.timestamps),
+    }
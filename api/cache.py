@@ -0,0 +1,139 @@
+"""Tweets Cache.
+
+This module keeps the raw tweets fetched from twitter api in memory so
+    repeated requests for the same hashtag/user can be answered without
+    calling twitter again.
+The cache is limit-aware: a result fetched for count N answers any
+    request with a limit <= N by slicing, and a request for a bigger limit
+    only needs the missing older tail (fetched with ``max_id``).
+
+    Example usage:
+        >>> from api.cache import CachedResult, TweetsCache
+        >>> cache = TweetsCache(timeout=60)
+        >>> cache.set(("search", "#nyc"), CachedResult(<twitter_api_tweets>))
+        >>> cache.get(("search", "#nyc")).statuses[:10]
+
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class CachedResult:
+    """Twitter api tweet objects fetched for a single (endpoint, query) key, newest first."""
+
+    def __init__(self, statuses, exhausted=False, created=None):
+        """Instantiate a new api.cache.CachedResult object.
+
+        Args:
+          statuses (list):
+            list of twitter api tweet objects ordered from newest to oldest.
+          exhausted (bool, optional):
+            True if twitter has no older tweets for this key.
+          created (float, optional):
+            monotonic time of the first fetch, Defaults to now.
+
+        """
+        self.statuses = list(statuses)
+        self.exhausted = exhausted
+        self.created = time.monotonic() if created is None else created
+
+    @property
+    def max_id(self):
+        """The ``max_id`` to use to fetch the tweets older than the cached ones."""
+        if not self.statuses:
+            return None
+        return self.statuses[-1]['id'] - 1
+
+    def can_answer(self, count):
+        """Check if this result has enough tweets to answer ``count``.
+
+        Args:
+            count (int):
+                number of requested tweets.
+
+        Returns:
+            True if no upstream call is needed.
+
+        """
+        return self.exhausted or len(self.statuses) >= count
+
+    def extend(self, statuses, exhausted):
+        """Return a new result with the older ``statuses`` appended.
+
+        The creation time is kept so the tail never refreshes the head.
+
+        Args:
+            statuses (list):
+                older tweets fetched using ``max_id``.
+            exhausted (bool):
+                True if twitter has no more older tweets.
+
+        Returns:
+            api.cache.CachedResult.
+
+        """
+        return CachedResult(self.statuses + list(statuses), exhausted, self.created)
+
+
+class TweetsCache:
+    """A thread safe, bounded, in memory LRU cache of api.cache.CachedResult."""
+
+    def __init__(self, timeout=60, max_entries=1024):
+        """Instantiate a new api.cache.TweetsCache object.
+
+        Args:
+          timeout (float, optional):
+            number of seconds a result stays fresh, Defaults to 60.
+          max_entries (int, optional):
+            maximum number of keys to keep, Defaults to 1024.
+
+        """
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get the fresh cached result of the given key.
+
+        Args:
+            key (tuple):
+                (endpoint, query) key.
+
+        Returns:
+            api.cache.CachedResult or None if missing or expired.
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.created >= self.timeout:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        """Store the result of the given key evicting the least recently used one if full.
+
+        Args:
+            key (tuple):
+                (endpoint, query) key.
+            entry (api.cache.CachedResult):
+                the result to store.
+
+        """
+        if self.timeout <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all the cached results."""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,280 @@
+"""Cluster Mode.
+
+This module shards the api queries across several nodes so each hot
+    hashtag/user is fetched and cached by a single node.
+Every ``(endpoint, query)`` key is owned by one node of a consistent hash
+    ring, a node which receives a request it doesn't own forwards it to the
+    owner over a pooled HTTP session and relays the response.
+Adding or removing a node only moves the keys of the ring arcs it owns, and
+    an owner which refuses the connection is skipped for
+    ``settings.CLUSTER_DOWN_PERIOD`` seconds (its keys move to the next node
+    of the ring) while the request is served locally, an owner which is too
+    slow to respond is kept and the request fails with a 504 error.
+Cluster mode is enabled by setting ``settings.CLUSTER_NODES`` and
+    ``settings.CLUSTER_SELF``.
+
+    Example usage:
+        >>> from api.cluster import HashRing
+        >>> ring = HashRing(["http://node1:8000", "http://node2:8000"])
+        >>> ring.get_node("hashtags:#nyc")
+      To route a view:
+        >>> @cluster_route("hashtags", "hashtag")
+        ... @api_view(['GET'])
+        ... def my_view(request, hashtag):
+        ...     pass
+
+"""
+import bisect
+import functools
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse, JsonResponse
+from requests.exceptions import ConnectionError, ReadTimeout, RequestException
+
+from .utils import requests_retry_session
+
+logger = logging.getLogger(__name__)
+
+FORWARDED_HEADER = "X-Cluster-Forwarded"
+# request headers sent to the owner node and response headers relayed back
+FORWARD_REQUEST_HEADERS = ("Accept", "X-Profile")
+RELAY_RESPONSE_HEADERS = ("Retry-After", "X-Profile-Id")
+
+
+def hash_key(key):
+    """Hash a string to a position on the ring.
+
+    Args:
+        key (str):
+            the string to hash.
+
+    Returns:
+        int position.
+
+    """
+    return int(hashlib.md5(key.encode("utf8")).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """A consistent hash ring with virtual nodes."""
+
+    def __init__(self, nodes=(), replicas=100):
+        """Instantiate a new api.cluster.HashRing object.
+
+        Args:
+          nodes (iterable, optional):
+            the nodes names (e.g. base urls).
+          replicas (int, optional):
+            number of virtual nodes per node, Defaults to 100.
+
+        """
+        self.replicas = replicas
+        self.nodes = set()
+        self._positions = []
+        self._owners = []
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node):
+        """Add a node to the ring.
+
+        Args:
+            node (str):
+                the node name.
+
+        """
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for replica in range(self.replicas):
+            position = hash_key("%s#%d" % (node, replica))
+            index = bisect.bisect(self._positions, position)
+            self._positions.insert(index, position)
+            self._owners.insert(index, node)
+
+    def remove_node(self, node):
+        """Remove a node from the ring.
+
+        Args:
+            node (str):
+                the node name.
+
+        """
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        kept = [(position, owner) for position, owner in zip(self._positions, self._owners) if owner != node]
+        self._positions = [position for position, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def get_node(self, key, exclude=()):
+        """Get the owner of a key.
+
+        Args:
+            key (str):
+                the key.
+            exclude (iterable, optional):
+                nodes to skip, their keys move to the next node of the ring.
+
+        Returns:
+            the owner node name or None if there is no available node.
+
+        """
+        if not self._positions:
+            return None
+        start = bisect.bisect(self._positions, hash_key(key))
+        for offset in range(len(self._positions)):
+            owner = self._owners[(start + offset) % len(self._positions)]
+            if owner not in exclude:
+                return owner
+        return None
+
+
+class Cluster:
+    """The nodes of the cluster and the pooled HTTP session used to forward requests."""
+
+    def __init__(self, nodes, self_node, timeout=10, down_period=30, pool_size=50):
+        """Instantiate a new api.cluster.Cluster object.
+
+        Args:
+          nodes (iterable):
+            base urls of all the nodes including this one.
+          self_node (str):
+            base url of this node, it must be one of ``nodes``.
+          timeout (float, optional):
+            seconds to wait for the owner node response, Defaults to 10.
+          down_period (float, optional):
+            seconds an unreachable node is skipped, Defaults to 30.
+          pool_size (int, optional):
+            number of kept alive connections per node, Defaults to 50.
+
+        Raises:
+            django.core.exceptions.ImproperlyConfigured: if ``self_node`` is not one of ``nodes``.
+
+        """
+        nodes = [node.rstrip("/") for node in nodes]
+        self_node = self_node.rstrip("/")
+        if self_node and nodes and self_node not in nodes:
+            raise ImproperlyConfigured("The cluster self node %s is not one of the cluster nodes %s."
+                                       % (self_node, ", ".join(nodes)))
+        self.ring = HashRing(nodes)
+        self.self_node = self_node
+        self.timeout = timeout
+        self.down_period = down_period
+        # the owner responses, errors included, are relayed as is
+        self.session = requests_retry_session(status_forcelist=(), retries=0, pool_maxsize=pool_size)
+        self._down = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """True if there are other nodes to share the keys with."""
+        return bool(self.self_node) and len(self.ring.nodes) > 1
+
+    def owner(self, key):
+        """Get the owner of a key skipping the unreachable nodes.
+
+        Args:
+            key (str):
+                ``<endpoint>:<query>`` key.
+
+        Returns:
+            base url of the owner node.
+
+        """
+        now = time.monotonic()
+        with self._lock:
+            down = [node for node, until in self._down.items() if until > now]
+        return self.ring.get_node(key, exclude=down) or self.self_node
+
+    def mark_down(self, node):
+        """Skip a node for ``down_period`` seconds."""
+        with self._lock:
+            self._down[node] = time.monotonic() + self.down_period
+
+    def forward(self, node, request, timeout=None):
+        """Send the request to the owner node.
+
+        Args:
+            node (str):
+                base url of the owner node.
+            request (django.http.HttpRequest):
+                django request object.
+            timeout (float, optional):
+                seconds to wait for the owner node response, Defaults to ``self.timeout``.
+
+        Returns:
+            django.http.HttpResponse relaying the owner response.
+
+        Raises:
+            requests.exceptions.RequestException: if the owner is unreachable.
+
+        """
+        headers = {name: request.headers[name] for name in FORWARD_REQUEST_HEADERS if name in request.headers}
+        headers[FORWARDED_HEADER] = self.self_node
+        url = node + request.get_full_path()
+        response = self.session.get(url, headers=headers, timeout=timeout or self.timeout)
+        relayed = HttpResponse(response.content, status=response.status_code,
+                               content_type=response.headers.get("Content-Type"))
+        for name in RELAY_RESPONSE_HEADERS:
+            if name in response.headers:
+                relayed[name] = response.headers[name]
+        relayed[FORWARDED_HEADER] = node
+        return relayed
+
+
+def cluster_route(endpoint, query_kwarg, timeout=None):
+    """Decorate a view to serve its ``(endpoint, query)`` keys on their owner node.
+
+    Requests already forwarded by another node are always served locally.
+    If the owner is unreachable it is marked down and the request is served
+        locally, if it doesn't respond in time the request fails with a 504
+        error, serving it locally would only add to the load of the cluster.
+
+    Args:
+        endpoint (str):
+            the endpoint part of the key, views sharing cached data
+            should use the same endpoint.
+        query_kwarg (str):
+            name of the view argument used as the query part of the key.
+        timeout (float, optional):
+            seconds to wait for the owner node response,
+            Defaults to settings.CLUSTER_FORWARD_TIMEOUT.
+
+    Returns:
+        decorator.
+
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not cluster.enabled or FORWARDED_HEADER in request.headers:
+                return view(request, *args, **kwargs)
+            node = cluster.owner("%s:%s" % (endpoint, kwargs[query_kwarg].lower()))
+            if node == cluster.self_node:
+                return view(request, *args, **kwargs)
+            try:
+                return cluster.forward(node, request, timeout)
+            except ConnectionError as e:
+                logger.warning("Failed to connect to %s, serving %s locally: %s", node, request.path, e)
+                cluster.mark_down(node)
+                return view(request, *args, **kwargs)
+            except ReadTimeout:
+                logger.warning("Timed out waiting for %s to serve %s", node, request.path)
+                return JsonResponse({"error": "The cluster node %s timed out." % node}, status=504)
+            except RequestException as e:
+                logger.warning("Failed to forward %s to %s: %s", request.path, node, e)
+                return JsonResponse({"error": "Failed to forward the request to %s." % node}, status=502)
+        return wrapper
+    return decorator
+
+
+cluster = Cluster(settings.CLUSTER_NODES, settings.CLUSTER_SELF,
+                  timeout=settings.CLUSTER_FORWARD_TIMEOUT,
+                  down_period=settings.CLUSTER_DOWN_PERIOD,
+                  pool_size=settings.CLUSTER_POOL_SIZE)
@@ -0,0 +1,436 @@
+"""Bulk Exports.
+
+This module exports tens of thousands of tweets of a hashtag or a user
+    timeline in the background.
+A job is enqueued by api.exports.ExportWorker.submit, the worker pages
+    through twitter api with ``max_id`` at the pace allowed by the export
+    rate limit budget and appends every page to a gzip compressed NDJSON file,
+    so the memory used doesn't depend on the number of exported tweets.
+The job state is saved next to the output file after every page
+    (``<job_id>.json``) with the ``max_id`` checkpoint and the size of the
+    output file, an interrupted job resumes from its last checkpoint.
+A job is run by the process holding the exclusive lock of its
+    ``<job_id>.lock`` file, the workers look for the jobs without a running
+    process every ``settings.EXPORT_RESUME_INTERVAL`` seconds, so several
+    processes (or nodes sharing ``settings.EXPORT_DIR``) never export the same
+    job and the jobs of a dead process are resumed by the others.
+
+    Example usage:
+        >>> from api.exports import get_worker
+        >>> job = get_worker().submit("hashtag", "#nyc", 20000)
+        >>> get_worker().get_job(job.id).exported
+        >>> job.output_path
+
+"""
+import fcntl
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from requests.exceptions import ConnectionError
+
+from .admission import Overloaded
+from .serializers import TweetSerializer
+from .twitter import Tweet, TwitterApi, TwitterException
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+HASHTAG = "hashtag"
+USER = "user"
+KINDS = (HASHTAG, USER)
+
+
+class ExportJob:
+    """The state of an export job, saved as json in the exports directory."""
+
+    FIELDS = ("id", "kind", "query", "limit", "status", "exported", "max_id",
+              "output_size", "error", "created", "updated")
+
+    def __init__(self, kind, query, limit, directory, **state):
+        """Instantiate a new api.exports.ExportJob object.
+
+        Args:
+          kind (str):
+            ``hashtag`` or ``user``.
+          query (str):
+            the hashtag or the user screen_name.
+          limit (int):
+            maximum number of tweets to export.
+          directory (str):
+            the directory of the job state and output files.
+          **state:
+            saved state of the job (see ExportJob.FIELDS).
+
+        """
+        self.kind = kind
+        self.query = query
+        self.limit = limit
+        self.directory = directory
+        self.id = state.get("id") or str(uuid.uuid4())
+        self.status = state.get("status", QUEUED)
+        self.exported = state.get("exported", 0)
+        self.max_id = state.get("max_id")
+        self.output_size = state.get("output_size", 0)
+        self.error = state.get("error")
+        self.created = state.get("created") or time.time()
+        self.updated = state.get("updated") or self.created
+
+    @property
+    def state_path(self):
+        """Path of the job state file."""
+        return os.path.join(self.directory, "%s.json" % self.id)
+
+    @property
+    def output_path(self):
+        """Path of the gzip compressed NDJSON output file."""
+        return os.path.join(self.directory, "%s.ndjson.gz" % self.id)
+
+    @property
+    def lock_path(self):
+        """Path of the job lock file."""
+        return os.path.join(self.directory, "%s.lock" % self.id)
+
+    def to_dict(self):
+        """Get the job state as dict."""
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def save(self):
+        """Atomically write the job state file."""
+        self.updated = time.time()
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as state_file:
+            json.dump(self.to_dict(), state_file)
+        os.replace(tmp_path, self.state_path)
+
+    @classmethod
+    def load(cls, path):
+        """Read a job from its state file.
+
+        Args:
+            path (str):
+                path of the job state file.
+
+        Returns:
+            api.exports.ExportJob.
+
+        """
+        with open(path) as state_file:
+            state = json.load(state_file)
+        return cls(directory=os.path.dirname(path), **state)
+
+
+class RateBudget:
+    """A sliding window limit of the number of calls."""
+
+    def __init__(self, calls, period):
+        """Instantiate a new api.exports.RateBudget object.
+
+        Args:
+          calls (int):
+            maximum number of calls per period.
+          period (float):
+            the window length in seconds.
+
+        """
+        self.calls = calls
+        self.period = period
+        self._history = deque()
+        self._lock = threading.Lock()
+
+    def wait(self, stopped=None):
+        """Block until a call is allowed and count it.
+
+        Args:
+            stopped (threading.Event, optional):
+                stop waiting early when set.
+
+        Returns:
+            False if ``stopped`` was set while waiting.
+
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._history and self._history[0] <= now - self.period:
+                    self._history.popleft()
+                if len(self._history) < self.calls:
+                    self._history.append(now)
+                    return True
+                delay = self._history[0] + self.period - now
+            if stopped is None:
+                time.sleep(delay)
+            elif stopped.wait(delay):
+                return False
+
+
+class ExportWorker(threading.Thread):
+    """A daemon thread which runs the export jobs one by one."""
+
+    def __init__(self, directory=settings.EXPORT_DIR,
+                 api_factory=TwitterApi.init_from_settings,
+                 budget=None):
+        """Instantiate a new api.exports.ExportWorker object.
+
+        Args:
+          directory (str, optional):
+            the directory of the jobs state and output files.
+          api_factory (callable, optional):
+            returns the api.twitter.TwitterApi used to fetch the tweets.
+          budget (api.exports.RateBudget, optional):
+            the twitter api calls budget of this worker, Defaults to this process share
+            of settings.EXPORT_RATE_LIMIT calls per settings.EXPORT_RATE_LIMIT_WINDOW.
+
+        """
+        super(ExportWorker, self).__init__(name="export-worker", daemon=True)
+        self.directory = directory
+        self.api_factory = api_factory
+        self.budget = budget or RateBudget(max(settings.EXPORT_RATE_LIMIT // settings.EXPORT_WORKERS, 1),
+                                           settings.EXPORT_RATE_LIMIT_WINDOW)
+        self.stopped = threading.Event()
+        self._queue = queue.Queue()
+        # ids of the jobs waiting in the queue
+        self._queued = set()
+        self._queued_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _enqueue(self, job_id):
+        """Enqueue a job id unless it is already waiting in the queue."""
+        with self._queued_lock:
+            if job_id in self._queued:
+                return False
+            self._queued.add(job_id)
+        self._queue.put(job_id)
+        return True
+
+    def submit(self, kind, query, limit):
+        """Create and enqueue an export job.
+
+        Args:
+            kind (str):
+                ``hashtag`` or ``user``.
+            query (str):
+                the hashtag or the user screen_name.
+            limit (int):
+                maximum number of tweets to export.
+
+        Returns:
+            api.exports.ExportJob.
+
+        """
+        job = ExportJob(kind, query, limit, self.directory)
+        job.save()
+        self._enqueue(job.id)
+        return job
+
+    def get_job(self, job_id):
+        """Get a job by id.
+
+        Args:
+            job_id (str):
+                the job id.
+
+        Returns:
+            api.exports.ExportJob or None if it doesn't exist or its state file can't be read.
+
+        """
+        path = os.path.join(self.directory, "%s.json" % job_id)
+        try:
+            return ExportJob.load(path)
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError) as e:
+            logger.warning("Skipped the unreadable export job state file %s: %s", path, e)
+            return None
+
+    def lock_job(self, job):
+        """Take the exclusive lock of a job without waiting.
+
+        The lock is released when the returned file is closed or the process exits.
+
+        Args:
+            job (api.exports.ExportJob):
+                the job.
+
+        Returns:
+            the open lock file or None if the job is locked by another process or thread.
+
+        """
+        lock_file = open(job.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def resume(self):
+        """Enqueue the queued and interrupted jobs which no process is running, oldest first.
+
+        Returns:
+            number of resumed jobs.
+
+        """
+        jobs = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                job = self.get_job(name[:-len(".json")])
+                if job is None or job.status not in (QUEUED, RUNNING):
+                    continue
+                lock_file = self.lock_job(job)
+                if lock_file is not None:
+                    lock_file.close()
+                    jobs.append(job)
+        resumed = 0
+        for job in sorted(jobs, key=lambda job: job.created):
+            resumed += self._enqueue(job.id)
+        return resumed
+
+    def run(self):
+        """Run the enqueued jobs until stopped, resuming the jobs without a running process periodically."""
+        next_resume = 0
+        while not self.stopped.is_set():
+            if time.monotonic() >= next_resume:
+                next_resume = time.monotonic() + settings.EXPORT_RESUME_INTERVAL
+                try:
+                    self.resume()
+                except Exception:
+                    logger.exception("Failed to resume the export jobs")
+            try:
+                job_id = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            with self._queued_lock:
+                self._queued.discard(job_id)
+            try:
+                self.process(job_id)
+            except Exception:
+                # keep running the other jobs
+                logger.exception("Failed to process export job %s", job_id)
+
+    def process(self, job_id):
+        """Run a job holding its lock, unless it is finished or run by another process.
+
+        Args:
+            job_id (str):
+                the job id.
+
+        """
+        job = self.get_job(job_id)
+        if job is None or job.status not in (QUEUED, RUNNING):
+            return
+        lock_file = self.lock_job(job)
+        if lock_file is None:
+            return
+        with lock_file:
+            # the previous owner may have saved the job since it was read
+            job = self.get_job(job_id)
+            if job.status not in (QUEUED, RUNNING):
+                return
+            try:
+                self.run_job(job)
+            except Exception as e:
+                logger.exception("Export job %s failed", job.id)
+                job.status = FAILED
+                job.error = str(e)
+                job.save()
+
+    def fetch_page(self, api, job):
+        """Fetch the next page of the job tweets respecting the rate limit budget.
+
+        Temporary errors (shed calls, twitter rate limit and connection errors)
+            are retried after a delay.
+
+        Args:
+            api (api.twitter.TwitterApi):
+                twitter api.
+            job (api.exports.ExportJob):
+                the job.
+
+        Returns:
+            list of twitter api tweet objects or None if the worker is stopped.
+
+        Raises:
+            TwitterException: if twitter api returned a permanent error.
+
+        """
+        fetch = api.get_hashtag_statuses if job.kind == HASHTAG else api.get_user_statuses
+        page_size = api.SEARCH_PAGE_SIZE if job.kind == HASHTAG else api.TIMELINE_PAGE_SIZE
+        count = min(page_size, job.limit - job.exported)
+        while self.budget.wait(self.stopped):
+            try:
+                return fetch(job.query, job.max_id, count)
+            except Overloaded as e:
+                delay = e.retry_after
+            except TwitterException as e:
+                if e.code != 429:
+                    raise
+                delay = settings.EXPORT_RETRY_DELAY
+            except ConnectionError:
+                delay = settings.EXPORT_RETRY_DELAY
+            logger.info("Export job %s paused for %s seconds", job.id, delay)
+            if self.stopped.wait(delay):
+                break
+        return None
+
+    def run_job(self, job):
+        """Export the job tweets from its last checkpoint, the caller holds the job lock.
+
+        Args:
+            job (api.exports.ExportJob):
+                the job.
+
+        """
+        job.status = RUNNING
+        job.save()
+        api = self.api_factory()
+        # drop what was written after the last checkpoint
+        with open(job.output_path, "ab") as output:
+            output.truncate(job.output_size)
+        while job.exported < job.limit:
+            statuses = self.fetch_page(api, job)
+            if statuses is None:
+                return
+            if not statuses:
+                break
+            data = TweetSerializer([Tweet(tweet_data) for tweet_data in statuses], many=True).data
+            lines = "".join(json.dumps(tweet) + "\n" for tweet in data)
+            # every page is a gzip member, the members are read as one stream
+            with gzip.open(job.output_path, "ab") as output:
+                output.write(lines.encode("utf8"))
+            job.exported += len(statuses)
+            job.max_id = statuses[-1]['id'] - 1
+            job.output_size = os.path.getsize(job.output_path)
+            job.save()
+        job.status = DONE
+        job.save()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker():
+    """Get the export worker of this process, starting it on first use or if it died.
+
+    Returns:
+        api.exports.ExportWorker.
+
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = ExportWorker()
+            _worker.start()
+        return _worker
@@ -0,0 +1,169 @@
+"""Tweets Inverted Index.
+
+This module keeps an in memory inverted index of the recently fetched
+    tweets so keyword filters are answered by intersecting postings instead
+    of calling twitter api or scanning the tweets.
+Every tweet is indexed by the lower cased words of its text, its hashtags
+    (``#tag``), its author (``@screen_name``) and the scopes it was fetched
+    for (e.g. ``search:#nyc``, ``user:anymindgroup``).
+The index is bounded, the oldest indexed tweets are evicted with their postings.
+
+    Example usage:
+        >>> from api.index import TweetIndex
+        >>> index = TweetIndex(max_tweets=50000)
+        >>> index.add(<twitter_api_tweets>, scope="search:#nyc")
+        >>> index.search("pizza #food", scope="search:#nyc", count=10)
+
+"""
+import heapq
+import re
+import threading
+from collections import OrderedDict
+
+WORD_RE = re.compile(r"\w+")
+QUERY_TERM_RE = re.compile(r"[#@]?\w+")
+
+
+def query_terms(query):
+    """Split a query to lower cased terms.
+
+    Args:
+        query (str):
+            words, ``#hashtags`` and ``@screen_names`` separated by spaces or commas.
+
+    Returns:
+        set of terms.
+
+    """
+    return set(QUERY_TERM_RE.findall(query.lower()))
+
+
+def tweet_terms(tweet_data):
+    """Get the terms of a twitter api tweet object.
+
+    Args:
+        tweet_data (dict):
+            twitter api tweet object.
+
+    Returns:
+        set of terms.
+
+    """
+    terms = set(WORD_RE.findall(tweet_data['text'].lower()))
+    for tag in tweet_data.get('entities', {}).get('hashtags', ()):
+        terms.add("#%s" % tag['text'].lower())
+    screen_name = tweet_data.get('user', {}).get('screen_name')
+    if screen_name:
+        terms.add("@%s" % screen_name.lower())
+    return terms
+
+
+class TweetIndex:
+    """A thread safe and bounded inverted index of twitter api tweet objects."""
+
+    def __init__(self, max_tweets=50000):
+        """Instantiate a new api.index.TweetIndex object.
+
+        Args:
+          max_tweets (int, optional):
+            maximum number of indexed tweets, Defaults to 50000.
+
+        """
+        self.max_tweets = max_tweets
+        # tweet id: (tweet_data, terms), oldest indexed first
+        self._tweets = OrderedDict()
+        # term: set of tweet ids
+        self._postings = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Number of indexed tweets."""
+        return len(self._tweets)
+
+    def add(self, statuses, scope=None):
+        """Index tweets or refresh the already indexed ones.
+
+        Args:
+            statuses (list):
+                twitter api tweet objects.
+            scope (str, optional):
+                extra term of the tweets, the query they were fetched for.
+
+        """
+        with self._lock:
+            for tweet_data in statuses:
+                tweet_id = tweet_data['id']
+                terms = tweet_terms(tweet_data)
+                if scope:
+                    terms.add(scope)
+                if tweet_id in self._tweets:
+                    terms |= self._tweets[tweet_id][1]
+                    self._tweets.move_to_end(tweet_id)
+                self._tweets[tweet_id] = (tweet_data, terms)
+                for term in terms:
+                    self._postings.setdefault(term, set()).add(tweet_id)
+            while len(self._tweets) > self.max_tweets:
+                self._evict()
+
+    def unindexed(self, statuses, scope=None):
+        """Get the tweets which are not indexed (e.g. evicted) or not indexed with a scope.
+
+        Args:
+            statuses (list):
+                twitter api tweet objects.
+            scope (str, optional):
+                the scope the tweets must be indexed with.
+
+        Returns:
+            list of twitter api tweet objects.
+
+        """
+        with self._lock:
+            return [tweet_data for tweet_data in statuses
+                    if tweet_data['id'] not in self._tweets
+                    or (scope and scope not in self._tweets[tweet_data['id']][1])]
+
+    def _evict(self):
+        """Remove the oldest indexed tweet and its postings, must be called with the lock held."""
+        tweet_id, (_, terms) = self._tweets.popitem(last=False)
+        for term in terms:
+            postings = self._postings[term]
+            postings.discard(tweet_id)
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query, scope=None, count=None):
+        """Find the newest tweets matching all the query terms.
+
+        Args:
+            query (str):
+                words, ``#hashtags`` and ``@screen_names``.
+            scope (str, optional):
+                only match the tweets indexed with this scope.
+            count (int, optional):
+                maximum number of tweets to return, Defaults to all.
+
+        Returns:
+            list of twitter api tweet objects, newest first, empty if the query has no terms.
+
+        """
+        terms = query_terms(query)
+        # a query without terms matches nothing rather than the whole scope
+        if not terms:
+            return []
+        if scope:
+            terms.add(scope)
+        with self._lock:
+            postings = sorted((self._postings.get(term, set()) for term in terms), key=len)
+            ids = postings[0].intersection(*postings[1:])
+            if count is None:
+                ids = sorted(ids, reverse=True)
+            else:
+                ids = heapq.nlargest(count, ids)
+            return [self._tweets[tweet_id][0] for tweet_id in ids]
+
+    def clear(self):
+        """Remove all the indexed tweets."""
+        with self._lock:
+            self._tweets.clear()
+            self._postings.clear()
@@ -0,0 +1,154 @@
+"""Requests Profiling.
+
+This module allow you to profile some of the api requests in production.
+A request is profiled if it has the ``X-Profile`` header set to
+    ``settings.PROFILING_TOKEN`` or if it is picked by the
+    ``settings.PROFILING_SAMPLE_RATE`` random sampling.
+The whole view is profiled with cProfile, including twitter api calls,
+    Tweet objects construction, serialization and rendering, then the raw
+    profile (``.prof``) and a summary of the top hot functions (``.txt``)
+    are written to ``settings.PROFILING_DIR``, only the newest
+    ``settings.PROFILING_MAX_PROFILES`` profiles are kept.
+When profiling is off the overhead is a header lookup and a comparison.
+
+    Example usage:
+        >>> from api.profiling import profile_view
+        >>> @profile_view
+        ... @api_view(['GET'])
+        ... def my_view(request):
+        ...     pass
+      To read a profile:
+        >>> import pstats
+        >>> pstats.Stats(<profile_path>).sort_stats("cumulative").print_stats(20)
+
+"""
+import cProfile
+import functools
+import hmac
+import io
+import logging
+import os
+import pstats
+import random
+import time
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+
+
+def should_profile(request):
+    """Check if the request should be profiled.
+
+    Args:
+        request (django.http.HttpRequest):
+            django request object.
+
+    Returns:
+        True if the request has a valid profiling token or is sampled.
+
+    """
+    token = request.META.get(PROFILE_HEADER)
+    if token and settings.PROFILING_TOKEN:
+        # the header is decoded as latin-1, compare_digest only accepts ascii str
+        return hmac.compare_digest(token.encode("latin-1", "replace"), settings.PROFILING_TOKEN.encode("utf8"))
+    rate = settings.PROFILING_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+def prune_profiles(directory, max_profiles):
+    """Delete the oldest profiles of a directory.
+
+    Args:
+        directory (str):
+            the profiles directory.
+        max_profiles (int):
+            number of profiles to keep, 0 keeps all the profiles.
+
+    """
+    if max_profiles <= 0:
+        return
+    profiles = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(".prof"):
+            try:
+                profiles.append((entry.stat().st_mtime, entry.path[:-len(".prof")]))
+            except FileNotFoundError:
+                continue
+    profiles.sort()
+    for _, path in profiles[:-max_profiles]:
+        for extension in (".prof", ".txt"):
+            try:
+                os.remove(path + extension)
+            except FileNotFoundError:
+                # already deleted by another process
+                pass
+
+
+def write_profile(profiler, name, directory=None, top=None):
+    """Write the profile and the summary of the top hot functions.
+
+    Args:
+        profiler (cProfile.Profile):
+            the disabled profiler.
+        name (str):
+            name of the profiled view.
+        directory (str, optional):
+            the output directory, Defaults to settings.PROFILING_DIR.
+        top (int, optional):
+            number of functions in the summary, Defaults to settings.PROFILING_TOP.
+
+    Returns:
+        the id of the profile, the files are ``<id>.prof`` and ``<id>.txt``.
+
+    """
+    directory = directory or settings.PROFILING_DIR
+    top = top or settings.PROFILING_TOP
+    os.makedirs(directory, exist_ok=True)
+    profile_id = "%s-%s-%s" % (time.strftime("%Y%m%d%H%M%S"), name, uuid.uuid4().hex[:8])
+    path = os.path.join(directory, profile_id)
+    profiler.dump_stats(path + ".prof")
+    summary = io.StringIO()
+    stats = pstats.Stats(profiler, stream=summary)
+    stats.sort_stats("cumulative").print_stats(top)
+    stats.sort_stats("tottime").print_stats(top)
+    with open(path + ".txt", "w") as summary_file:
+        summary_file.write(summary.getvalue())
+    prune_profiles(directory, settings.PROFILING_MAX_PROFILES)
+    return profile_id
+
+
+def profile_view(view):
+    """Decorate a view to profile the requests picked by api.profiling.should_profile.
+
+    The response is rendered inside the profiler and gets a ``X-Profile-Id`` header.
+
+    Args:
+        view (callable):
+            django view.
+
+    Returns:
+        the decorated view.
+
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not should_profile(request):
+            return view(request, *args, **kwargs)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = view(request, *args, **kwargs)
+            if callable(getattr(response, "render", None)):
+                response.render()
+        finally:
+            profiler.disable()
+        try:
+            response["X-Profile-Id"] = write_profile(profiler, view.__name__)
+        except OSError:
+            logger.exception("Failed to write the profile of %s", view.__name__)
+        return response
+    return wrapper
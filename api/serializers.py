@@ -19,7 +19,12 @@ class AccountSerializer(serializers.Serializer):
 
 
 class TweetSerializer(serializers.Serializer):
-    """A Django Rest Framework Serializer Used to serializer/deserialize Tweet."""
+    """A Django Rest Framework Serializer Used to serializer/deserialize Tweet.
+
+    Example usage:
+      To only serialize some fields:
+        >>> TweetSerializer(<tweets>, many=True, fields=("text", "likes")).data
+    """
 
     account = AccountSerializer()
     date = serializers.CharField()
@@ -28,3 +33,17 @@ class TweetSerializer(serializers.Serializer):
     replies = serializers.IntegerField()
     retweets = serializers.IntegerField()
     text = serializers.CharField()
+
+    def __init__(self, *args, **kwargs):
+        """Instantiate a new api.serializers.TweetSerializer object.
+
+        Args:
+          fields (iterable, optional):
+            names of the fields to serialize, Defaults to all the fields.
+
+        """
+        fields = kwargs.pop('fields', None)
+        super(TweetSerializer, self).__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
@@ -0,0 +1,229 @@
+"""Hashtag Live Stream.
+
+This module streams the new tweets of a hashtag to many subscribers
+    (e.g. Server-Sent Events clients) using a single upstream poller.
+Each process has at most one api.stream.HashtagPoller per hashtag which
+    polls twitter with ``since_id`` and fans out every new tweet to all the
+    hashtag subscribers through bounded per-subscriber buffers.
+A subscriber whose buffer is full is dropped so a slow client never stalls
+    the poller or the other subscribers.
+Each poller uses ``900 / interval`` twitter search calls per 15 minutes, the
+    number of polled hashtags is capped so the pollers can't use up the
+    rate limit of the interactive endpoints.
+
+    Example usage:
+        >>> from api.stream import hub
+        >>> subscriber = hub.subscribe("#nyc")
+        >>> event = subscriber.get(timeout=15)
+        >>> hub.unsubscribe("#nyc", subscriber)
+
+"""
+import json
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from requests.exceptions import ConnectionError
+
+from .admission import Overloaded
+from .serializers import TweetSerializer
+from .twitter import TwitterApi, TwitterException
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """A bounded buffer of events waiting to be sent to a single client."""
+
+    def __init__(self, buffer_size):
+        """Instantiate a new api.stream.Subscriber object.
+
+        Args:
+          buffer_size (int):
+            maximum number of events waiting to be sent to the client.
+
+        """
+        self._queue = queue.Queue(maxsize=buffer_size)
+        self.dropped = False
+
+    def publish(self, event):
+        """Add an event to the buffer without blocking.
+
+        Args:
+            event (str):
+                the event to send.
+
+        Returns:
+            False if the buffer is full and the subscriber is dropped.
+
+        """
+        if self.dropped:
+            return False
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped = True
+        return not self.dropped
+
+    def get(self, timeout=None):
+        """Wait for the next event.
+
+        Args:
+            timeout (float, optional):
+                maximum number of seconds to wait.
+
+        Returns:
+            the next event or None if the timeout expired.
+
+        """
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class HashtagPoller(threading.Thread):
+    """A daemon thread which polls the new tweets of a hashtag and publish them to the subscribers."""
+
+    def __init__(self, hub, hashtag):
+        """Instantiate a new api.stream.HashtagPoller object.
+
+        Args:
+          hub (api.stream.StreamHub):
+            the hub which owns the hashtag subscribers.
+          hashtag (str):
+            Twitter Hashtag.
+
+        """
+        super(HashtagPoller, self).__init__(name="hashtag-poller-%s" % hashtag, daemon=True)
+        self.hub = hub
+        self.hashtag = hashtag
+        self.since_id = None
+        # the first poll only sets the starting point of the stream, even if it is empty
+        self.started = False
+        self.stopped = threading.Event()
+
+    def poll(self):
+        """Fetch the tweets newer than ``since_id`` and publish them oldest first."""
+        api = self.hub.api_factory()
+        tweets = api.get_hashtag_tweets_since(self.hashtag, self.since_id)
+        first_poll = not self.started
+        self.started = True
+        if not tweets:
+            return
+        self.since_id = max(tweet.id for tweet in tweets)
+        if first_poll or self.stopped.is_set():
+            return
+        for data in reversed(TweetSerializer(tweets, many=True).data):
+            self.hub.publish(self.hashtag, "data: %s\n\n" % json.dumps(data))
+
+    def run(self):
+        """Poll twitter every ``hub.interval`` seconds until stopped."""
+        while not self.stopped.is_set():
+            try:
+                self.poll()
+            except (TwitterException, ConnectionError, Overloaded) as e:
+                logger.warning("Failed to poll hashtag %s tweets: %s", self.hashtag, e)
+            except Exception:
+                # keep polling, the subscribers have no other source of tweets
+                logger.exception("Unexpected error while polling hashtag %s", self.hashtag)
+            self.stopped.wait(self.hub.interval)
+
+
+class StreamHub:
+    """Registry of the hashtags subscribers and their pollers."""
+
+    def __init__(self, api_factory=TwitterApi.init_from_settings,
+                 interval=settings.TWITTER_STREAM_POLL_INTERVAL,
+                 buffer_size=settings.TWITTER_STREAM_BUFFER_SIZE,
+                 max_hashtags=settings.TWITTER_STREAM_MAX_HASHTAGS):
+        """Instantiate a new api.stream.StreamHub object.
+
+        Args:
+          api_factory (callable, optional):
+            returns the api.twitter.TwitterApi used by the pollers.
+          interval (float, optional):
+            number of seconds between two polls of the same hashtag.
+          buffer_size (int, optional):
+            maximum number of events buffered per subscriber.
+          max_hashtags (int, optional):
+            maximum number of hashtags polled at the same time.
+
+        """
+        self.api_factory = api_factory
+        self.interval = interval
+        self.buffer_size = buffer_size
+        self.max_hashtags = max_hashtags
+        self._subscribers = {}
+        self._pollers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, hashtag):
+        """Subscribe to the new tweets of a hashtag starting its poller if needed.
+
+        Args:
+            hashtag (str):
+                Twitter Hashtag.
+
+        Returns:
+            api.stream.Subscriber.
+
+        Raises:
+            api.admission.Overloaded: if ``max_hashtags`` hashtags are already polled.
+
+        """
+        subscriber = Subscriber(self.buffer_size)
+        with self._lock:
+            if hashtag not in self._pollers and len(self._pollers) >= self.max_hashtags:
+                raise Overloaded("Too many streamed hashtags.", int(self.interval))
+            self._subscribers.setdefault(hashtag, set()).add(subscriber)
+            if hashtag not in self._pollers:
+                poller = HashtagPoller(self, hashtag)
+                self._pollers[hashtag] = poller
+                poller.start()
+        return subscriber
+
+    def unsubscribe(self, hashtag, subscriber):
+        """Remove a subscriber stopping the hashtag poller if it was the last one.
+
+        Args:
+            hashtag (str):
+                Twitter Hashtag.
+            subscriber (api.stream.Subscriber):
+                the subscriber to remove.
+
+        """
+        with self._lock:
+            subscribers = self._subscribers.get(hashtag, set())
+            subscribers.discard(subscriber)
+            if not subscribers:
+                self._subscribers.pop(hashtag, None)
+                poller = self._pollers.pop(hashtag, None)
+                if poller is not None:
+                    poller.stopped.set()
+
+    def publish(self, hashtag, event):
+        """Send an event to all the hashtag subscribers dropping the slow ones.
+
+        Args:
+            hashtag (str):
+                Twitter Hashtag.
+            event (str):
+                the event to send.
+
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(hashtag, ()))
+        for subscriber in subscribers:
+            if not subscriber.publish(event):
+                logger.info("Dropped a slow subscriber of hashtag %s", hashtag)
+                self.unsubscribe(hashtag, subscriber)
+
+    def subscribers_count(self, hashtag):
+        """Number of subscribers of a hashtag."""
+        with self._lock:
+            return len(self._subscribers.get(hashtag, ()))
+
+
+hub = StreamHub()
@@ -1,15 +1,71 @@
-from unittest.mock import patch
+import gzip
+import json
+import os
+import tempfile
+import threading
+from unittest.mock import Mock, patch
 
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.shortcuts import reverse
-from django.test import TestCase
-from requests.exceptions import ConnectionError
+from django.test import TestCase, override_settings
+from requests.exceptions import ConnectionError, ConnectTimeout, ReadTimeout
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from api.admission import BACKGROUND, BATCH, INTERACTIVE, AdmissionController, Overloaded
+from api.analytics import hashtag_analytics
+from api.cluster import Cluster, HashRing
+from api.exports import DONE, HASHTAG, QUEUED, RUNNING, USER, ExportWorker, RateBudget
+from api.index import TweetIndex
+from api.stream import HashtagPoller, StreamHub
 from api.twitter import Account, Tweet, TwitterApi, TwitterException
 
 
+def make_tweet_data(tweet_id, text="hello #nyc", hashtags=("nyc",), likes=0, retweets=0,
+                    created_at="Wed Oct 10 20:19:24 +0000 2018"):
+    """Build a twitter api tweet object."""
+    return {
+        "id": tweet_id,
+        "created_at": created_at,
+        "entities": {"hashtags": [{"text": tag} for tag in hashtags]},
+        "user": {"name": "AnyMind Group", "screen_name": "AnyMindGroup", "id": 1},
+        "favorite_count": likes,
+        "retweet_count": retweets,
+        "text": text,
+    }
+
+
+class FakeTwitterSession:
+    """A fake requests session which answers twitter api calls from a list of tweets."""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.calls = []
+
+    def get(self, url, params=None, auth=None):
+        self.calls.append(dict(params))
+        max_id = params.get("max_id")
+        since_id = params.get("since_id", 0)
+        tweets = [tweet for tweet in self.statuses
+                  if (max_id is None or tweet["id"] <= max_id) and tweet["id"] > since_id]
+        tweets = tweets[:params["count"]]
+        response = Mock(ok=True, status_code=200)
+        if url.endswith("/search/tweets.json"):
+            response.json.return_value = {"statuses": tweets}
+        else:
+            response.json.return_value = tweets
+        return response
+
+
+def fake_twitter_api(statuses):
+    """Create api.twitter.TwitterApi which doesn't connect to twitter."""
+    with patch.object(TwitterApi, 'get_bearer_token'):
+        api = TwitterApi("key", "secret")
+    api.session = FakeTwitterSession(statuses)
+    return api
+
+
 class TwitterApiTestCase(TestCase):
     def setUp(self):
         key = settings.TWITTER_API_KEY
@@ -51,6 +107,728 @@ class TwitterApiTestCase(TestCase):
             self.twitter_api.get_user_timeline(self.hashtag_failure)
 
 
+class TwitterApiCacheTestCase(TestCase):
+    def setUp(self):
+        statuses = [make_tweet_data(tweet_id) for tweet_id in range(500, 0, -1)]
+        self.twitter_api = fake_twitter_api(statuses)
+        self.session = self.twitter_api.session
+
+    def test_smaller_limit_is_sliced_from_cache(self):
+        """Test a smaller limit is answered from a bigger cached result."""
+        tweets = self.twitter_api.get_hashtag_tweets("#nyc", 100)
+        self.assertEqual(len(tweets), 100)
+        tweets = self.twitter_api.get_hashtag_tweets("#nyc", 30)
+        self.assertEqual([tweet.id for tweet in tweets], list(range(500, 470, -1)))
+        self.assertEqual(len(self.session.calls), 1)
+
+    def test_bigger_limit_fetches_missing_tail(self):
+        """Test a bigger limit only fetches the older tweets using max_id."""
+        self.twitter_api.get_hashtag_tweets("#nyc", 30)
+        tweets = self.twitter_api.get_hashtag_tweets("#nyc", 100)
+        self.assertEqual([tweet.id for tweet in tweets], list(range(500, 400, -1)))
+        self.assertEqual(len(self.session.calls), 2)
+        self.assertEqual(self.session.calls[1]["count"], 70)
+        self.assertEqual(self.session.calls[1]["max_id"], 470)
+
+    def test_limit_bigger_than_page_size(self):
+        """Test a limit bigger than twitter page size is fetched page by page."""
+        tweets = self.twitter_api.get_hashtag_tweets("#nyc", 250)
+        self.assertEqual(len(tweets), 250)
+        self.assertEqual([call["count"] for call in self.session.calls], [100, 100, 50])
+
+    def test_views_limit_is_capped(self):
+        """Test the hashtag and user timeline views cap the limit."""
+        with patch.object(TwitterApi, 'init_from_settings', return_value=self.twitter_api), \
+                override_settings(TWITTER_MAX_LIMIT=150):
+            response = self.client.get(reverse('tweets-hashtag', kwargs={"hashtag": "#nyc"}),
+                                       data={'limit': 1000000})
+            self.assertEqual(len(response.json()), 150)
+            response = self.client.get(reverse('user-timeline', kwargs={"screen_name": "AnyMindGroup"}),
+                                       data={'limit': 1000000})
+            self.assertEqual(len(response.json()), 150)
+        self.assertEqual(sum(call["count"] for call in self.session.calls), 300)
+
+    def test_exhausted_result_is_not_refetched(self):
+        """Test a short result is not fetched again for bigger limits."""
+        self.session.statuses = self.session.statuses[:10]
+        self.assertEqual(len(self.twitter_api.get_user_timeline("AnyMindGroup", 30)), 10)
+        self.assertEqual(len(self.twitter_api.get_user_timeline("AnyMindGroup", 50)), 10)
+        self.assertEqual(len(self.session.calls), 2)
+        self.assertEqual(self.session.calls[1]["max_id"], 490)
+
+    def test_short_pages_are_not_exhausted(self):
+        """Test pages shorter than their count don't end the result."""
+        get = self.session.get
+
+        def short_first_page(url, params=None, auth=None):
+            response = get(url, params, auth)
+            if len(self.session.calls) == 1:
+                response.json.return_value = response.json.return_value[:-3]
+            return response
+
+        with patch.object(self.session, 'get', side_effect=short_first_page):
+            tweets = self.twitter_api.get_user_timeline("AnyMindGroup", 300)
+        self.assertEqual(len(tweets), 300)
+        self.assertEqual([call["count"] for call in self.session.calls], [200, 103])
+
+    def test_keys_are_separated(self):
+        """Test different queries and endpoints don't share results."""
+        self.twitter_api.get_hashtag_tweets("#nyc", 10)
+        self.twitter_api.get_hashtag_tweets("#tokyo", 10)
+        self.twitter_api.get_user_timeline("#nyc", 10)
+        self.assertEqual(len(self.session.calls), 3)
+
+    def test_fetched_pages_are_kept_on_failure(self):
+        """Test the pages fetched before a failing page are not fetched again."""
+        get = self.session.get
+
+        def shed_third_page(url, params=None, auth=None):
+            if len(self.session.calls) == 2:
+                self.session.calls.append(dict(params))
+                raise Overloaded("shed", 1)
+            return get(url, params, auth)
+
+        with patch.object(self.session, 'get', side_effect=shed_third_page):
+            with self.assertRaises(Overloaded):
+                self.twitter_api.get_hashtag_tweets("#nyc", 300)
+        self.assertEqual(len(self.twitter_api.get_hashtag_tweets("#nyc", 300)), 300)
+        self.assertEqual(len(self.session.calls), 4)
+        self.assertEqual(self.session.calls[3]["max_id"], 300)
+
+    def test_negative_limit(self):
+        """Test a negative limit returns no tweets."""
+        self.twitter_api.get_hashtag_tweets("#nyc", 50)
+        self.assertEqual(self.twitter_api.get_hashtag_tweets("#nyc", -5), [])
+
+    def test_expired_result_is_refetched(self):
+        """Test an expired result is fetched again."""
+        self.twitter_api.cache.timeout = 0
+        self.twitter_api.get_hashtag_tweets("#nyc", 10)
+        self.twitter_api.get_hashtag_tweets("#nyc", 10)
+        self.assertEqual(len(self.session.calls), 2)
+
+
+class HashtagAnalyticsTestCase(TestCase):
+    def setUp(self):
+        statuses = [
+            make_tweet_data(4, hashtags=("nyc", "Tokyo"), likes=10, retweets=1,
+                            created_at="Wed Oct 10 21:30:00 +0000 2018"),
+            make_tweet_data(3, hashtags=("NYC", "tokyo", "music"), likes=20, retweets=2,
+                            created_at="Wed Oct 10 21:00:00 +0000 2018"),
+            make_tweet_data(2, hashtags=("nyc", "music"), likes=30, retweets=3,
+                            created_at="Wed Oct 10 20:59:59 +0000 2018"),
+            make_tweet_data(1, hashtags=("nyc", "news"), likes=40, retweets=4,
+                            created_at="Wed Oct 10 19:10:00 +0000 2018"),
+        ]
+        self.tweets = [Tweet(tweet_data) for tweet_data in statuses]
+        self.twitter_api = fake_twitter_api(statuses)
+
+    def test_hashtag_analytics(self):
+        """Test hashtag_analytics aggregates."""
+        stats = hashtag_analytics(self.tweets, "#nyc", top=2)
+        self.assertEqual(stats["count"], 4)
+        self.assertEqual(stats["likes"]["p50"], 25)
+        self.assertEqual(stats["likes"]["max"], 40)
+        self.assertEqual(stats["retweets"]["mean"], 2.5)
+        self.assertEqual(stats["top_hashtags"], [{"hashtag": "#music", "count": 2},
+                                                 {"hashtag": "#tokyo", "count": 2}])
+        self.assertEqual(stats["posting_rate"]["tweets_per_hour"], 4 / 3)
+        self.assertEqual(stats["posting_rate"]["hours"], [
+            {"hour": "2018-10-10T19:00:00Z", "count": 1},
+            {"hour": "2018-10-10T20:00:00Z", "count": 1},
+            {"hour": "2018-10-10T21:00:00Z", "count": 2},
+        ])
+
+    def test_hashtag_analytics_empty(self):
+        """Test hashtag_analytics without tweets."""
+        stats = hashtag_analytics([], "nyc")
+        self.assertEqual(stats["count"], 0)
+        self.assertIsNone(stats["likes"]["p99"])
+        self.assertEqual(stats["top_hashtags"], [])
+        self.assertEqual(stats["posting_rate"]["hours"], [])
+
+    def test_get_hashtag_analytics_view(self):
+        """Test get_hashtag_analytics view success."""
+        url = reverse('hashtag-analytics', kwargs={"hashtag": "#nyc"})
+        with patch.object(TwitterApi, 'init_from_settings', return_value=self.twitter_api):
+            response = self.client.get(url, data={'limit': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual(response.data["likes"]["max"], 30)
+
+    def test_get_hashtag_analytics_view_invalid_top(self):
+        """Test get_hashtag_analytics view rejects a top which is not a positive integer."""
+        url = reverse('hashtag-analytics', kwargs={"hashtag": "#nyc"})
+        with patch.object(TwitterApi, 'init_from_settings', return_value=self.twitter_api):
+            for top in ("-1", "0", "ten"):
+                response = self.client.get(url, data={'top': top})
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.twitter_api.session.calls, [])
+
+
+class FieldsProjectionTestCase(APITestCase):
+    def setUp(self):
+        statuses = [make_tweet_data(tweet_id, likes=tweet_id) for tweet_id in range(10, 0, -1)]
+        self.twitter_api = fake_twitter_api(statuses)
+        self.session = self.twitter_api.session
+        patcher = patch.object(TwitterApi, 'init_from_settings', return_value=self.twitter_api)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_tweet_fields(self):
+        """Test Tweet only builds the requested fields."""
+        tweet = Tweet(make_tweet_data(1), fields=("text",))
+        self.assertEqual(tweet.text, "hello #nyc")
+        self.assertFalse(hasattr(tweet, "account"))
+        self.assertFalse(hasattr(tweet, "hashtags"))
+
+    def test_hashtag_fields(self):
+        """Test get_tweets_by_hashtag view with fields."""
+        url = reverse('tweets-hashtag', kwargs={"hashtag": "#nyc"})
+        response = self.client.get(url, data={'fields': 'text,likes', 'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{"likes": 10, "text": "hello #nyc"},
+                                         {"likes": 9, "text": "hello #nyc"}])
+        self.assertIs(self.session.calls[0]["include_entities"], False)
+
+    def test_user_timeline_fields(self):
+        """Test get_user_timeline view trims the user when account is not requested."""
+        url = reverse('user-timeline', kwargs={"screen_name": "AnyMindGroup"})
+        response = self.client.get(url, data={'fields': 'hashtags'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0], {"hashtags": ["#nyc"]})
+        self.assertIs(self.session.calls[0]["trim_user"], True)
+        response = self.client.get(url)
+        self.assertEqual(response.data[0]["account"]["href"], "/AnyMindGroup")
+        self.assertIs(self.session.calls[2]["trim_user"], False)
+
+    def test_projection_reuses_full_payload(self):
+        """Test a projected request is answered from the cached full payload."""
+        url = reverse('tweets-hashtag', kwargs={"hashtag": "#nyc"})
+        self.client.get(url, data={'limit': 5})
+        response = self.client.get(url, data={'fields': 'text,likes', 'limit': 2})
+        self.assertEqual(response.data, [{"likes": 10, "text": "hello #nyc"},
+                                         {"likes": 9, "text": "hello #nyc"}])
+        url = reverse('user-timeline', kwargs={"screen_name": "AnyMindGroup"})
+        self.client.get(url, data={'limit': 5})
+        response = self.client.get(url, data={'fields': 'likes', 'limit': 1})
+        self.assertEqual(response.data, [{"likes": 10}])
+        self.assertEqual(len(self.session.calls), 2)
+
+    def test_unknown_fields(self):
+        """Test unknown fields are rejected."""
+        url = reverse('tweets-hashtag', kwargs={"hashtag": "#nyc"})
+        response = self.client.get(url, data={'fields': 'text,password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("error", response.data)
+        self.assertEqual(self.session.calls, [])
+
+
+class HashtagStreamTestCase(TestCase):
+    def setUp(self):
+        self.statuses = [make_tweet_data(2), make_tweet_data(1)]
+        self.twitter_api = fake_twitter_api(self.statuses)
+        self.session = self.twitter_api.session
+        self.hub = StreamHub(api_factory=lambda: self.twitter_api, interval=60, buffer_size=2)
+        # pollers are driven manually
+        patcher = patch.object(HashtagPoller, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_tweets(self, *ids):
+        self.statuses[:0] = [make_tweet_data(tweet_id) for tweet_id in sorted(ids, reverse=True)]
+
+    def test_single_poller_fans_out(self):
+        """Test all the hashtag subscribers share one poller."""
+        first = self.hub.subscribe("#nyc")
+        second = self.hub.subscribe("#nyc")
+        poller = self.hub._pollers["#nyc"]
+        self.assertEqual(len(self.hub._pollers), 1)
+        poller.poll()
+        self.assertIsNone(first.get(timeout=0))
+        self.add_tweets(3, 4)
+        poller.poll()
+        self.assertEqual(len(self.session.calls), 2)
+        self.assertEqual(self.session.calls[1]["since_id"], 2)
+        for subscriber in (first, second):
+            self.assertIn('"text": "hello #nyc"', subscriber.get(timeout=0))
+            self.assertTrue(subscriber.get(timeout=0).startswith("data: "))
+
+    def test_quiet_hashtag(self):
+        """Test the first tweets of a hashtag without tweets when subscribed are published."""
+        self.statuses.clear()
+        subscriber = self.hub.subscribe("#nyc")
+        poller = self.hub._pollers["#nyc"]
+        poller.poll()
+        self.add_tweets(1)
+        poller.poll()
+        self.assertTrue(subscriber.get(timeout=0).startswith("data: "))
+
+    def test_slow_subscriber_is_dropped(self):
+        """Test a subscriber with a full buffer is dropped without affecting the others."""
+        slow = self.hub.subscribe("#nyc")
+        fast = self.hub.subscribe("#nyc")
+        poller = self.hub._pollers["#nyc"]
+        poller.poll()
+        self.add_tweets(3)
+        poller.poll()
+        fast.get(timeout=0)
+        self.add_tweets(4, 5)
+        poller.poll()
+        self.assertTrue(slow.dropped)
+        self.assertFalse(fast.dropped)
+        self.assertEqual(self.hub.subscribers_count("#nyc"), 1)
+        self.assertIsNotNone(fast.get(timeout=0))
+
+    def test_streamed_hashtags_are_capped(self):
+        """Test a new hashtag is rejected once the maximum number of hashtags is polled."""
+        self.hub.max_hashtags = 1
+        subscriber = self.hub.subscribe("#nyc")
+        self.hub.subscribe("#nyc")
+        with self.assertRaises(Overloaded):
+            self.hub.subscribe("#tokyo")
+        self.assertNotIn("#tokyo", self.hub._pollers)
+        with patch('api.views.hub', self.hub):
+            response = self.client.get(reverse('hashtag-stream', kwargs={"hashtag": "#tokyo"}))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], "60")
+        self.hub.unsubscribe("#nyc", subscriber)
+        self.hub.unsubscribe("#nyc", next(iter(self.hub._subscribers["#nyc"])))
+        self.hub.subscribe("#tokyo")
+
+    def test_poller_stops_without_subscribers(self):
+        """Test the poller is stopped when the last subscriber leaves."""
+        subscriber = self.hub.subscribe("#nyc")
+        poller = self.hub._pollers["#nyc"]
+        self.hub.unsubscribe("#nyc", subscriber)
+        self.assertTrue(poller.stopped.is_set())
+        self.assertNotIn("#nyc", self.hub._pollers)
+
+
+class AdmissionControllerTestCase(TestCase):
+    def setUp(self):
+        self.controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+
+    def wait_in_queue(self, priority):
+        """Start a thread waiting for a slot and return its result list."""
+        result = []
+
+        def target():
+            try:
+                self.controller.acquire(priority)
+                result.append("admitted")
+            except Overloaded:
+                result.append("shed")
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        while not result and self.controller.metrics()["queue_depth"] == 0:
+            thread.join(0.001)
+        return thread, result
+
+    def test_queue_full_is_shed(self):
+        """Test calls are shed when the slots and the queue are full."""
+        self.controller.acquire()
+        thread, result = self.wait_in_queue(INTERACTIVE)
+        with self.assertRaises(Overloaded):
+            self.controller.acquire(INTERACTIVE)
+        self.controller.release()
+        thread.join()
+        self.assertEqual(result, ["admitted"])
+        metrics = self.controller.metrics()
+        self.assertEqual(metrics["shed"]["queue_full"], 1)
+        self.assertEqual(metrics["admitted"], 2)
+        self.assertEqual(metrics["in_flight"], 1)
+
+    def test_lower_priority_is_preempted(self):
+        """Test a higher priority call takes the queue place of a lower priority one."""
+        self.controller.acquire()
+        thread, result = self.wait_in_queue(BACKGROUND)
+        batch_thread, batch_result = self.wait_in_queue(BATCH)
+        thread.join()
+        self.assertEqual(result, ["shed"])
+        self.controller.release()
+        batch_thread.join()
+        self.assertEqual(batch_result, ["admitted"])
+        self.assertEqual(self.controller.metrics()["shed"]["preempted"], 1)
+
+    def test_queue_timeout(self):
+        """Test a call waiting longer than queue_timeout is shed."""
+        self.controller.queue_timeout = 0.01
+        with self.controller.admit():
+            with self.assertRaises(Overloaded):
+                self.controller.acquire()
+        metrics = self.controller.metrics()
+        self.assertEqual(metrics["shed"]["timeout"], 1)
+        self.assertEqual(metrics["queue_depth"], 0)
+        self.assertEqual(metrics["in_flight"], 0)
+
+    def test_overloaded_view(self):
+        """Test the views return 503 with Retry-After when the call is shed."""
+        twitter_api = fake_twitter_api([make_tweet_data(1)])
+        twitter_api.admission = AdmissionController(max_concurrency=0, max_queue=0, queue_timeout=0,
+                                                    retry_after=3)
+        url = reverse('tweets-hashtag', kwargs={"hashtag": "#nyc"})
+        with patch.object(TwitterApi, 'init_from_settings', return_value=twitter_api):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], "3")
+        self.assertIn("error", response.json())
+        self.assertEqual(twitter_api.session.calls, [])
+
+    def test_metrics_view(self):
+        """Test get_metrics view."""
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("queue_depth", response.json()["admission"])
+
+
+class ProfilingTestCase(APITestCase):
+    def setUp(self):
+        self.twitter_api = fake_twitter_api([make_tweet_data(1)])
+        patcher = patch.object(TwitterApi, 'init_from_settings', return_value=self.twitter_api)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.profiles_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profiles_dir.cleanup)
+        self.url = reverse('tweets-hashtag', kwargs={"hashtag": "#nyc"})
+
+    def test_profile_with_token(self):
+        """Test a request with the profiling token is profiled."""
+        with override_settings(PROFILING_TOKEN="secret", PROFILING_DIR=self.profiles_dir.name):
+            response = self.client.get(self.url, HTTP_X_PROFILE="secret")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        profile_id = response["X-Profile-Id"]
+        self.assertIn("get_tweets_by_hashtag", profile_id)
+        self.assertTrue(os.path.exists(os.path.join(self.profiles_dir.name, profile_id + ".prof")))
+        with open(os.path.join(self.profiles_dir.name, profile_id + ".txt")) as summary:
+            self.assertIn("get_hashtag_tweets", summary.read())
+
+    def test_not_profiled(self):
+        """Test requests without a valid token are not profiled when sampling is off."""
+        with override_settings(PROFILING_TOKEN="secret", PROFILING_DIR=self.profiles_dir.name,
+                               PROFILING_SAMPLE_RATE=0):
+            response = self.client.get(self.url, HTTP_X_PROFILE="wrong")
+            self.assertNotIn("X-Profile-Id", response)
+            response = self.client.get(self.url, HTTP_X_PROFILE="café")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("X-Profile-Id", response)
+        with override_settings(PROFILING_TOKEN="", PROFILING_DIR=self.profiles_dir.name):
+            response = self.client.get(self.url, HTTP_X_PROFILE="")
+            self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(os.listdir(self.profiles_dir.name), [])
+
+    def test_old_profiles_are_deleted(self):
+        """Test only the newest profiles are kept."""
+        with override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_DIR=self.profiles_dir.name,
+                               PROFILING_MAX_PROFILES=2):
+            profile_ids = []
+            for mtime in range(3):
+                profile_ids.append(self.client.get(self.url)["X-Profile-Id"])
+                os.utime(os.path.join(self.profiles_dir.name, profile_ids[-1] + ".prof"), (mtime, mtime))
+        self.assertEqual(sorted(os.listdir(self.profiles_dir.name)),
+                         sorted(profile_id + extension for profile_id in profile_ids[1:]
+                                for extension in (".prof", ".txt")))
+
+    def test_profile_sampling(self):
+        """Test requests are profiled by the sampling rate."""
+        with override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_DIR=self.profiles_dir.name):
+            response = self.client.get(self.url)
+        self.assertIn("X-Profile-Id", response)
+
+
+class TweetIndexTestCase(APITestCase):
+    def setUp(self):
+        statuses = [
+            make_tweet_data(4, text="Best pizza in #nyc", hashtags=("nyc", "food")),
+            make_tweet_data(3, text="Rainy day in #nyc", hashtags=("nyc",)),
+            make_tweet_data(2, text="pizza again #nyc", hashtags=("nyc", "food")),
+            make_tweet_data(1, text="Hello world", hashtags=()),
+        ]
+        self.twitter_api = fake_twitter_api(statuses)
+        self.session = self.twitter_api.session
+        patcher = patch.object(TwitterApi, 'init_from_settings', return_value=self.twitter_api)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_index_search(self):
+        """Test TweetIndex matches all the terms newest first."""
+        index = TweetIndex()
+        index.add(self.session.statuses, scope="search:#nyc")
+        self.assertEqual([t["id"] for t in index.search("PIZZA")], [4, 2])
+        self.assertEqual([t["id"] for t in index.search("pizza #food", count=1)], [4])
+        self.assertEqual([t["id"] for t in index.search("@anymindgroup hello")], [1])
+        self.assertEqual(index.search("pizza", scope="search:#tokyo"), [])
+        self.assertEqual(index.search("burger"), [])
+        self.assertEqual(index.search("!!! ,", scope="search:#nyc"), [])
+
+    def test_index_eviction(self):
+        """Test the oldest indexed tweets are evicted with their postings."""
+        index = TweetIndex(max_tweets=2)
+        index.add(self.session.statuses[2:], scope="search:#nyc")
+        index.add(self.session.statuses[:2], scope="search:#nyc")
+        self.assertEqual(len(index), 2)
+        self.assertEqual([t["id"] for t in index.search("pizza")], [4])
+        self.assertNotIn("world", index._postings)
+
+    def test_hashtag_contains(self):
+        """Test get_tweets_by_hashtag view contains filter is answered from the index."""
+        url = reverse('tweets-hashtag', kwargs={"hashtag": "#nyc"})
+        response = self.client.get(url, data={'contains': 'pizza', 'fields': 'text'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([tweet["text"] for tweet in response.data],
+                         ["Best pizza in #nyc", "pizza again #nyc"])
+        self.assertEqual(len(self.session.calls), 2)
+        self.assertIs(self.session.calls[0]["include_entities"], True)
+        response = self.client.get(url, data={'q': 'rainy', 'limit': 1})
+        self.assertEqual(response.data[0]["text"], "Rainy day in #nyc")
+        self.assertEqual(len(self.session.calls), 2)
+
+    def test_contains_after_index_eviction(self):
+        """Test the cached tweets evicted from the index are indexed again."""
+        self.twitter_api.get_hashtag_tweets("#nyc", contains="pizza")
+        self.twitter_api.index.clear()
+        self.twitter_api.index.add([self.session.statuses[0]], scope="user:anymindgroup")
+        tweets = self.twitter_api.get_hashtag_tweets("#nyc", contains="pizza")
+        self.assertEqual([tweet.id for tweet in tweets], [4, 2])
+        self.assertEqual(len(self.session.calls), 2)
+
+    def test_user_timeline_contains(self):
+        """Test get_user_timeline view contains filter."""
+        url = reverse('user-timeline', kwargs={"screen_name": "AnyMindGroup"})
+        response = self.client.get(url, data={'contains': '#food', 'fields': 'text'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertIs(self.session.calls[0]["trim_user"], False)
+
+
+class ClusterTestCase(APITestCase):
+    def setUp(self):
+        self.nodes = ["http://node%d:8000" % i for i in range(4)]
+        self.keys = ["hashtags:#tag%d" % i for i in range(2000)]
+        self.cluster = Cluster(self.nodes, self.nodes[0])
+        patcher = patch('api.cluster.cluster', self.cluster)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.twitter_api = fake_twitter_api([make_tweet_data(1)])
+        patcher = patch.object(TwitterApi, 'init_from_settings', return_value=self.twitter_api)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def key_owned_by(self, node):
+        hashtag = next(key for key in self.keys if self.cluster.ring.get_node(key) == node)
+        return hashtag.split(":", 1)[1]
+
+    def test_ring_balance(self):
+        """Test the keys are shared between all the nodes."""
+        owners = [self.cluster.ring.get_node(key) for key in self.keys]
+        for node in self.nodes:
+            self.assertGreater(owners.count(node), len(self.keys) / len(self.nodes) / 2)
+
+    def test_ring_minimal_rehash(self):
+        """Test adding/removing a node only moves the keys it owns."""
+        ring = HashRing(self.nodes)
+        before = {key: ring.get_node(key) for key in self.keys}
+        ring.add_node("http://node4:8000")
+        after = {key: ring.get_node(key) for key in self.keys}
+        moved = [key for key in self.keys if before[key] != after[key]]
+        self.assertTrue(all(after[key] == "http://node4:8000" for key in moved))
+        self.assertLess(len(moved), len(self.keys) / 3)
+        ring.remove_node("http://node4:8000")
+        self.assertEqual(before, {key: ring.get_node(key) for key in self.keys})
+
+    def test_owned_key_is_served_locally(self):
+        """Test the owner node serves its keys."""
+        url = reverse('tweets-hashtag', kwargs={"hashtag": self.key_owned_by(self.nodes[0])})
+        with patch.object(self.cluster.session, 'get') as mock_get:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_get.assert_not_called()
+
+    def test_forward_to_owner(self):
+        """Test a request is forwarded to the owner node and its response relayed."""
+        hashtag = self.key_owned_by(self.nodes[2])
+        url = reverse('hashtag-analytics', kwargs={"hashtag": hashtag})
+        owner_response = Mock(status_code=503, content=b'{"error": "busy"}',
+                              headers={"Content-Type": "application/json", "Retry-After": "1"})
+        with patch.object(self.cluster.session, 'get', return_value=owner_response) as mock_get:
+            response = self.client.get(url, data={"limit": 10})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertEqual(response.json(), {"error": "busy"})
+        forwarded_url = mock_get.call_args[0][0]
+        self.assertTrue(forwarded_url.startswith(self.nodes[2] + "/hashtags/"))
+        self.assertTrue(forwarded_url.endswith("/analytics?limit=10"))
+        self.assertEqual(mock_get.call_args[1]["headers"]["X-Cluster-Forwarded"], self.nodes[0])
+        self.assertEqual(self.twitter_api.session.calls, [])
+
+    def test_forwarded_request_is_served_locally(self):
+        """Test a request forwarded by another node is not forwarded again."""
+        url = reverse('user-timeline', kwargs={"screen_name": "AnyMindGroup"})
+        with patch.object(self.cluster.session, 'get') as mock_get:
+            response = self.client.get(url, HTTP_X_CLUSTER_FORWARDED=self.nodes[1])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_get.assert_not_called()
+
+    def test_unreachable_owner(self):
+        """Test an unreachable owner is skipped and the request served locally."""
+        hashtag = self.key_owned_by(self.nodes[3])
+        url = reverse('tweets-hashtag', kwargs={"hashtag": hashtag})
+        with patch.object(self.cluster.session, 'get', side_effect=ConnectTimeout()):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(self.cluster.owner("hashtags:" + hashtag), self.nodes[3])
+
+    def test_slow_owner(self):
+        """Test a slow owner returns 504 and is kept in the ring."""
+        hashtag = self.key_owned_by(self.nodes[3])
+        url = reverse('tweets-hashtag', kwargs={"hashtag": hashtag})
+        with patch.object(self.cluster.session, 'get', side_effect=ReadTimeout()):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_504_GATEWAY_TIMEOUT)
+        self.assertEqual(self.cluster.owner("hashtags:" + hashtag), self.nodes[3])
+        self.assertEqual(self.twitter_api.session.calls, [])
+
+    def test_nodes_configuration(self):
+        """Test the trailing slashes of the nodes are ignored and the self node must be a node."""
+        cluster = Cluster([node + "/" for node in self.nodes], self.nodes[1] + "/")
+        self.assertEqual(cluster.self_node, self.nodes[1])
+        self.assertEqual(cluster.ring.nodes, set(self.nodes))
+        with self.assertRaises(ImproperlyConfigured):
+            Cluster(self.nodes, "http://node9:8000")
+
+
+class ExportTestCase(APITestCase):
+    def setUp(self):
+        statuses = [make_tweet_data(tweet_id) for tweet_id in range(300, 0, -1)]
+        self.twitter_api = fake_twitter_api(statuses)
+        self.session = self.twitter_api.session
+        self.exports_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.exports_dir.cleanup)
+        self.worker = ExportWorker(self.exports_dir.name, api_factory=lambda: self.twitter_api,
+                                   budget=RateBudget(100, 60))
+        patcher = patch('api.views.get_worker', return_value=self.worker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_output(self, job):
+        with gzip.open(job.output_path, "rt") as output:
+            return [json.loads(line) for line in output]
+
+    def test_export_job(self):
+        """Test an export job pages through twitter api and writes NDJSON."""
+        job = self.worker.submit(HASHTAG, "#nyc", 250)
+        self.worker.run_job(job)
+        job = self.worker.get_job(job.id)
+        self.assertEqual(job.status, DONE)
+        self.assertEqual(job.exported, 250)
+        self.assertEqual(job.max_id, 50)
+        self.assertEqual([call["count"] for call in self.session.calls], [100, 100, 50])
+        tweets = self.read_output(job)
+        self.assertEqual(len(tweets), 250)
+        self.assertEqual(tweets[0]["account"]["href"], "/AnyMindGroup")
+
+    def test_export_stops_when_exhausted(self):
+        """Test an export job finishes when there are no more tweets."""
+        job = self.worker.submit(USER, "AnyMindGroup", 1000)
+        self.worker.run_job(job)
+        job = self.worker.get_job(job.id)
+        self.assertEqual(job.status, DONE)
+        self.assertEqual(job.exported, 300)
+
+    def test_resume_from_checkpoint(self):
+        """Test an interrupted job resumes from its checkpoint without duplicates."""
+        job = self.worker.submit(HASHTAG, "#nyc", 100)
+        self.worker.run_job(job)
+        job = self.worker.get_job(job.id)
+        # simulate a crash after writing a page but before saving the checkpoint
+        with open(job.output_path, "ab") as output:
+            output.write(b"partial page")
+        job.status = RUNNING
+        job.limit = 250
+        job.save()
+        # a restarted process
+        worker = ExportWorker(self.exports_dir.name, api_factory=lambda: self.twitter_api,
+                              budget=RateBudget(100, 60))
+        self.assertEqual(worker.resume(), 1)
+        self.assertEqual(worker.resume(), 0)
+        worker.process(worker._queue.get_nowait())
+        job = worker.get_job(job.id)
+        self.assertEqual(self.session.calls[1]["max_id"], 200)
+        self.assertEqual(len(self.read_output(job)), 250)
+
+    def test_locked_job_is_skipped(self):
+        """Test a job locked by another process is neither resumed nor run."""
+        job = self.worker.submit(HASHTAG, "#nyc", 100)
+        worker = ExportWorker(self.exports_dir.name, api_factory=lambda: self.twitter_api,
+                              budget=RateBudget(100, 60))
+        with self.worker.lock_job(job):
+            self.assertEqual(worker.resume(), 0)
+            worker.process(job.id)
+            self.assertEqual(self.session.calls, [])
+            self.assertEqual(worker.get_job(job.id).status, QUEUED)
+        self.assertEqual(worker.resume(), 1)
+        worker.process(job.id)
+        self.assertEqual(worker.get_job(job.id).status, DONE)
+
+    def test_unreadable_state_file(self):
+        """Test an unreadable job state file is skipped without stopping the worker."""
+        with open(os.path.join(self.exports_dir.name, "broken.json"), "w") as state_file:
+            state_file.write("{trunc")
+        self.assertIsNone(self.worker.get_job("broken"))
+        job = self.worker.submit(HASHTAG, "#nyc", 10)
+        self.worker.start()
+        self.addCleanup(self.worker.stopped.set)
+        for _ in range(100):
+            if self.worker.get_job(job.id).status == DONE:
+                break
+            self.worker.stopped.wait(0.05)
+        self.assertEqual(self.worker.get_job(job.id).status, DONE)
+        self.assertTrue(self.worker.is_alive())
+
+    def test_rate_budget_is_shared_by_the_workers(self):
+        """Test each worker gets its share of the exports rate limit."""
+        with override_settings(EXPORT_RATE_LIMIT=180, EXPORT_WORKERS=4):
+            worker = ExportWorker(self.exports_dir.name)
+        self.assertEqual(worker.budget.calls, 45)
+
+    def test_rate_budget(self):
+        """Test the rate budget blocks the calls over its limit."""
+        budget = RateBudget(2, 60)
+        stopped = threading.Event()
+        self.assertTrue(budget.wait(stopped))
+        self.assertTrue(budget.wait(stopped))
+        stopped.set()
+        self.assertFalse(budget.wait(stopped))
+
+    def test_export_views(self):
+        """Test create_export, get_export and download_export views."""
+        response = self.client.post(reverse('exports'), data={"hashtag": "#nyc", "limit": 120},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response["Location"], response.data["url"])
+        job_id = response.data["id"]
+        download_url = reverse('export-download', kwargs={"job_id": job_id})
+        self.assertEqual(self.client.get(download_url).status_code, status.HTTP_404_NOT_FOUND)
+        self.worker.run_job(self.worker.get_job(job_id))
+        response = self.client.get(reverse('export', kwargs={"job_id": job_id}))
+        self.assertEqual(response.data["status"], DONE)
+        self.assertEqual(response.data["progress"], 1)
+        self.assertTrue(response.data["download"].endswith(download_url))
+        response = self.client.get(download_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        lines = gzip.decompress(b"".join(response.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 120)
+
+    def test_create_export_validation(self):
+        """Test create_export view rejects invalid jobs."""
+        for data in ({}, {"hashtag": "#nyc", "screen_name": "AnyMindGroup"}, {"hashtag": "#nyc", "limit": 0}):
+            response = self.client.post(reverse('exports'), data=data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(os.listdir(self.exports_dir.name), [])
+
+
 class ApiTestCase(APITestCase):
     def setUp(self):
         self.hashtag = "#nyc"
@@ -18,6 +18,7 @@ This module allow you Connect to twitter api and fetch some useful data from.
 
 """
 import base64
+import calendar
 import time
 
 import requests
@@ -25,6 +26,9 @@ from django.conf import settings
 from requests.utils import quote
 from requests_oauthlib import OAuth2
 
+from . import admission
+from .cache import CachedResult, TweetsCache
+from .index import TweetIndex
 from .utils import requests_retry_session, urljoin
 
 
@@ -60,28 +64,45 @@ class Tweet:
         >>> from api.serializers import Tweet
         >>> tweet=Tweet(<twitter_api_tweet_data>)
         >>> tweet.text
+      To only build some fields:
+        >>> tweet=Tweet(<twitter_api_tweet_data>, fields=("text", "likes"))
     """
 
-    def __init__(self, tweet_data):
+    DATE_FORMAT = '%-I:%-M %p - %-d %b %Y'
+    FIELDS = ("account", "date", "hashtags", "likes", "replies", "retweets", "text")
+
+    def __init__(self, tweet_data, fields=FIELDS):
         """Instantiate a new api.serializers.Tweet object.
 
         Args:
           tweet_data (dict):
             twitter api tweet object.
+          fields (iterable, optional):
+            names of the fields to build, the other fields are not set.
+            Defaults to all the fields.
 
         """
-        _hashtags = tweet_data['entities']['hashtags']
-        _str_date = tweet_data['created_at']
-        self.account = Account(tweet_data['user'])
-        self.date = self.format_date(_str_date)
-        self.hashtags = ["#%s" % (tag['text']) for tag in _hashtags]
-        self.likes = tweet_data['favorite_count']
-        # Note: replies number is only available with
-        # the Premium and Enterprise tier products.
-        # https://developer.twitter.com/en/docs/tweets/data-dictionary/overview/tweet-object # noqa
-        self.replies = 0
-        self.retweets = tweet_data['retweet_count']
-        self.text = tweet_data['text']
+        self.id = tweet_data['id']
+        if 'account' in fields:
+            self.account = Account(tweet_data['user'])
+        if 'date' in fields:
+            _created_at = self.parse_twitter_date(tweet_data['created_at'])
+            self.date = time.strftime(self.DATE_FORMAT, _created_at)
+            self.timestamp = calendar.timegm(_created_at)
+        if 'hashtags' in fields:
+            _hashtags = tweet_data['entities']['hashtags']
+            self.hashtags = ["#%s" % (tag['text']) for tag in _hashtags]
+        if 'likes' in fields:
+            self.likes = tweet_data['favorite_count']
+        if 'replies' in fields:
+            # Note: replies number is only available with
+            # the Premium and Enterprise tier products.
+            # https://developer.twitter.com/en/docs/tweets/data-dictionary/overview/tweet-object # noqa
+            self.replies = 0
+        if 'retweets' in fields:
+            self.retweets = tweet_data['retweet_count']
+        if 'text' in fields:
+            self.text = tweet_data['text']
 
     def parse_twitter_date(self, date):
         """Convert string Date to python datetime object.
@@ -107,14 +128,15 @@ class Tweet:
             formatted date in more readable format.
 
         """
-        return time.strftime('%-I:%-M %p - %-d %b %Y',
-                             self.parse_twitter_date(date))
+        return time.strftime(self.DATE_FORMAT, self.parse_twitter_date(date))
 
 
 class TwitterApi(object):
     """A python interface into communicate with the Twitter API."""
 
     _django_cached_obj = None
+    SEARCH_PAGE_SIZE = 100
+    TIMELINE_PAGE_SIZE = 200
 
     def __init__(self, api_key, api_secret, base_url=settings.TWITTER_API_URL):
         """Instantiate a new api.twitter.TwitterApi object.
@@ -139,6 +161,10 @@ class TwitterApi(object):
         self.get_bearer_token()
         self.set_requests_auth()
         self.session = requests_retry_session()
+        self.cache = TweetsCache(settings.TWITTER_CACHE_TIMEOUT,
+                                 settings.TWITTER_CACHE_MAX_ENTRIES)
+        self.admission = admission.controller
+        self.index = TweetIndex(settings.TWITTER_INDEX_MAX_TWEETS)
 
     def set_requests_auth(self):
         """Set requests auth obj for this instance using the bearer_token ."""
@@ -169,78 +195,308 @@ class TwitterApi(object):
         self.bearer_token = token_info
 
     def get_hashtag_tweets(self, hashtag,
-                           count=settings.TWITTER_DEFAULT_LIMIT):
+                           count=settings.TWITTER_DEFAULT_LIMIT, fields=Tweet.FIELDS,
+                           priority=admission.INTERACTIVE, contains=None):
         """Get tweets by a hashtag.
 
         Args:
           hashtag (str):
             Twitter Hashtag
           count (int, optional):
-            The number of tweets to return per page, up to a maximum of 100.
+            The number of tweets to return, requests bigger than
+            100 are fetched page by page.
             Defaults to 30.
+          fields (iterable, optional):
+            names of the api.twitter.Tweet fields to build, entities are
+            not requested from twitter if hashtags are not needed.
+            Defaults to all the fields.
+          priority (int, optional):
+            admission priority of the twitter api calls.
+            Defaults to api.admission.INTERACTIVE.
+          contains (str, optional):
+            only return the tweets matching all these words/hashtags,
+            see api.twitter.TwitterApi._get_tweets.
 
         Returns:
           list of hashtag tweets
 
         Raises:
             TwitterException: if twitter api returned an error.
+            api.admission.Overloaded: if the call is shed.
 
         """
-        url = urljoin(self.base_url, "/search/tweets.json")
-        response = self.session.get(
-            url,
-            params={
+        include_entities = 'hashtags' in fields or bool(contains)
+        return self._get_tweets(
+            "/search/tweets.json",
+            {
                 "q": hashtag,
-                "count": count,
-                "include_entities": True
+                "include_entities": include_entities
             },
-            auth=self.__auth,
+            count,
+            fields,
+            priority,
+            page_size=self.SEARCH_PAGE_SIZE,
+            statuses_key="statuses",
+            scope="search:%s" % hashtag.lower() if include_entities else None,
+            contains=contains,
+            full_params=None if include_entities else {"q": hashtag, "include_entities": True},
         )
-        data = response.json()
-        if response.ok:
-            data = [Tweet(tweet_data) for tweet_data in data['statuses']]
-        else:
-            if 'error' in data:
-                raise TwitterException(data['error'], code=response.status_code)
-            elif 'errors' in data:
-                error = data['errors'][0]
-                raise TwitterException(error['message'], code=response.status_code)
-        return data
+
+    def get_hashtag_tweets_since(self, hashtag, since_id=None,
+                                 count=SEARCH_PAGE_SIZE, fields=Tweet.FIELDS,
+                                 priority=admission.BACKGROUND):
+        """Get the most recent tweets of a hashtag newer than ``since_id``.
+
+        The result is never cached, it is used to poll the new tweets.
+
+        Args:
+          hashtag (str):
+            Twitter Hashtag
+          since_id (int, optional):
+            only return tweets with an id greater than this id.
+          count (int, optional):
+            The number of tweets to return, up to a maximum of 100.
+            Defaults to 100.
+          fields (iterable, optional):
+            names of the api.twitter.Tweet fields to build.
+            Defaults to all the fields.
+          priority (int, optional):
+            admission priority of the twitter api call.
+            Defaults to api.admission.BACKGROUND.
+
+        Returns:
+          list of hashtag tweets, newest first.
+
+        Raises:
+            TwitterException: if twitter api returned an error.
+            api.admission.Overloaded: if the call is shed.
+
+        """
+        params = {
+            "q": hashtag,
+            "count": count,
+            "result_type": "recent",
+            "include_entities": 'hashtags' in fields
+        }
+        if since_id is not None:
+            params["since_id"] = since_id
+        data = self._request("/search/tweets.json", params, priority)
+        return [Tweet(tweet_data, fields) for tweet_data in data["statuses"]]
+
+    def get_hashtag_statuses(self, hashtag, max_id=None, count=SEARCH_PAGE_SIZE,
+                             priority=admission.BATCH):
+        """Get a single page of raw hashtag tweets older than ``max_id``.
+
+        The result is never cached, it is used to page through big results.
+
+        Args:
+          hashtag (str):
+            Twitter Hashtag
+          max_id (int, optional):
+            only return tweets with an id less than or equal to this id.
+          count (int, optional):
+            The number of tweets to return, up to a maximum of 100.
+            Defaults to 100.
+          priority (int, optional):
+            admission priority of the twitter api call.
+            Defaults to api.admission.BATCH.
+
+        Returns:
+          list of twitter api tweet objects, newest first.
+
+        Raises:
+            TwitterException: if twitter api returned an error.
+            api.admission.Overloaded: if the call is shed.
+
+        """
+        params = {"q": hashtag, "count": count, "include_entities": True}
+        if max_id is not None:
+            params["max_id"] = max_id
+        return self._request("/search/tweets.json", params, priority)["statuses"]
+
+    def get_user_statuses(self, username, max_id=None, count=TIMELINE_PAGE_SIZE,
+                          priority=admission.BATCH):
+        """Get a single page of raw user timeline tweets older than ``max_id``.
+
+        The result is never cached, it is used to page through big results.
+
+        Args:
+          username (str):
+            Twitter screen_name, username.
+          max_id (int, optional):
+            only return tweets with an id less than or equal to this id.
+          count (int, optional):
+            The number of tweets to return, up to a maximum of 200.
+            Defaults to 200.
+          priority (int, optional):
+            admission priority of the twitter api call.
+            Defaults to api.admission.BATCH.
+
+        Returns:
+          list of twitter api tweet objects, newest first.
+
+        Raises:
+            TwitterException: if twitter api returned an error.
+            api.admission.Overloaded: if the call is shed.
+
+        """
+        params = {"screen_name": username, "count": count}
+        if max_id is not None:
+            params["max_id"] = max_id
+        return self._request("/statuses/user_timeline.json", params, priority)
 
     def get_user_timeline(self, username,
-                          count=settings.TWITTER_DEFAULT_LIMIT):
+                          count=settings.TWITTER_DEFAULT_LIMIT, fields=Tweet.FIELDS,
+                          priority=admission.INTERACTIVE, contains=None):
         """Get the list of tweets that the user has on his feed.
 
         Args:
           username (str):
             Twitter screen_name, username.
           count (int, optional):
-            The number of tweets to return per page, up to a maximum of 100.
+            The number of tweets to return, requests bigger than
+            200 are fetched page by page.
             Defaults to 30.
+          fields (iterable, optional):
+            names of the api.twitter.Tweet fields to build, the user
+            object is trimmed by twitter if account is not needed.
+            Defaults to all the fields.
+          priority (int, optional):
+            admission priority of the twitter api calls.
+            Defaults to api.admission.INTERACTIVE.
+          contains (str, optional):
+            only return the tweets matching all these words/hashtags,
+            see api.twitter.TwitterApi._get_tweets.
 
         Returns:
           list of tweets that the user has on his feed.
 
+        Raises:
+            TwitterException: if twitter api returned an error.
+            api.admission.Overloaded: if the call is shed.
+
         """
-        url = urljoin(self.base_url, "/statuses/user_timeline.json")
-        response = self.session.get(
-            url,
-            params={
+        trim_user = 'account' not in fields and not contains
+        return self._get_tweets(
+            "/statuses/user_timeline.json",
+            {
                 "screen_name": username,
-                "count": count,
                 # "include_entities": True
+                "trim_user": trim_user,
             },
-            auth=self.__auth,
+            count,
+            fields,
+            priority,
+            page_size=self.TIMELINE_PAGE_SIZE,
+            scope=None if trim_user else "user:%s" % username.lower(),
+            contains=contains,
+            full_params={"screen_name": username, "trim_user": False} if trim_user else None,
         )
-        data = response.json()
-        if response.ok:
-            data = [Tweet(tweet_data) for tweet_data in data]
+
+    def _get_tweets(self, path, params, count, fields, priority, page_size, statuses_key=None,
+                    scope=None, contains=None, full_params=None):
+        """Get ``count`` tweets from the cache fetching only the missing older tail from twitter.
+
+        The fetched tweets are added to the inverted index under ``scope``.
+        If ``contains`` is set, at least ``settings.TWITTER_INDEX_WINDOW``
+            tweets are fetched (or reused from the cache) and the newest tweets
+            of ``scope`` matching all the ``contains`` terms are read from the
+            index, so repeated keyword filters don't call twitter api.
+        A trimmed request is answered from the cached full payload of
+            ``full_params`` when it has enough tweets.
+
+        Args:
+          path (str):
+            twitter api endpoint path.
+          params (dict):
+            the query parameters of the endpoint without count/max_id.
+          count (int):
+            the number of tweets to return.
+          fields (iterable):
+            names of the api.twitter.Tweet fields to build.
+          priority (int):
+            admission priority of the twitter api calls.
+          page_size (int):
+            the maximum count twitter accepts for this endpoint.
+          statuses_key (str, optional):
+            the key of the tweets list in the response if it is not a list.
+          scope (str, optional):
+            index scope of the fetched tweets, they are not indexed if None.
+          contains (str, optional):
+            words, ``#hashtags`` or ``@screen_names`` the tweets must match.
+          full_params (dict, optional):
+            the query parameters of the full payload if ``params`` request
+            a trimmed one.
+
+        Returns:
+          list of api.twitter.Tweet.
+
+        Raises:
+            TwitterException: if twitter api returned an error.
+            api.admission.Overloaded: if the call is shed.
+
+        """
+        key = (path, tuple(sorted(params.items())))
+        count = max(count, 0)
+        fetch_count = max(count, settings.TWITTER_INDEX_WINDOW) if contains else count
+        entry = self.cache.get(key) or CachedResult([])
+        if full_params is not None and not entry.can_answer(fetch_count):
+            # the full payload has all the fields of the trimmed one
+            full_entry = self.cache.get((path, tuple(sorted(full_params.items()))))
+            if full_entry is not None and full_entry.can_answer(fetch_count):
+                entry = full_entry
+        while not entry.can_answer(fetch_count):
+            page_count = min(fetch_count - len(entry.statuses), page_size)
+            page_params = dict(params, count=page_count)
+            if entry.max_id is not None:
+                page_params["max_id"] = entry.max_id
+            data = self._request(path, page_params, priority)
+            if statuses_key:
+                data = data[statuses_key]
+            if scope:
+                self.index.add(data, scope)
+            # twitter returns short pages (deleted tweets, retweets) before the last one
+            entry = entry.extend(data, exhausted=not data)
+            # keep the fetched pages even if a next page fails
+            self.cache.set(key, entry)
+        if contains:
+            # the index is bounded apart from the cache, re-index the cached tweets it evicted
+            self.index.add(self.index.unindexed(entry.statuses, scope), scope)
+            statuses = self.index.search(contains, scope, count)
         else:
+            statuses = entry.statuses[:count]
+        return [Tweet(tweet_data, fields) for tweet_data in statuses]
+
+    def _request(self, path, params, priority=admission.INTERACTIVE):
+        """Send a GET request to twitter api once admitted by the admission controller.
+
+        Args:
+          path (str):
+            twitter api endpoint path.
+          params (dict):
+            the query parameters.
+          priority (int, optional):
+            admission priority of the call, Defaults to api.admission.INTERACTIVE.
+
+        Returns:
+          the decoded json response.
+
+        Raises:
+            TwitterException: if twitter api returned an error.
+            api.admission.Overloaded: if the call is shed.
+
+        """
+        url = urljoin(self.base_url, path)
+        with self.admission.admit(priority):
+            response = self.session.get(url, params=params, auth=self.__auth)
+        data = response.json()
+        if not response.ok:
             if 'error' in data:
                 raise TwitterException(data['error'], code=response.status_code)
             elif 'errors' in data:
                 error = data['errors'][0]
                 raise TwitterException(error['message'], code=response.status_code)
+            raise TwitterException("Unknown twitter api error.", code=response.status_code)
         return data
 
     @classmethod
@@ -15,9 +15,16 @@ Including another URLconf
 """
 from django.urls import path
 
-from .views import get_tweets_by_hashtag, get_user_timeline
+from .views import (create_export, download_export, get_export, get_hashtag_analytics, get_metrics,
+                    get_tweets_by_hashtag, get_user_timeline, stream_hashtag)
 
 urlpatterns = [
     path('hashtags/<str:hashtag>', get_tweets_by_hashtag, name="tweets-hashtag"),
+    path('hashtags/<str:hashtag>/analytics', get_hashtag_analytics, name="hashtag-analytics"),
+    path('hashtags/<str:hashtag>/stream', stream_hashtag, name="hashtag-stream"),
     path('users/<str:screen_name>', get_user_timeline, name="user-timeline"),
+    path('exports', create_export, name="exports"),
+    path('exports/<uuid:job_id>', get_export, name="export"),
+    path('exports/<uuid:job_id>/download', download_export, name="export-download"),
+    path('metrics', get_metrics, name="metrics"),
 ]
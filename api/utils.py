@@ -19,7 +19,8 @@ def urljoin(*args):
 
 def requests_retry_session(status_forcelist=(502, 503, 504),
                            retries=5,
-                           backoff_factor=1):
+                           backoff_factor=1,
+                           pool_maxsize=10):
     """Create requests session which support retry mechanism.
 
     Args:
@@ -30,6 +31,8 @@ def requests_retry_session(status_forcelist=(502, 503, 504),
             Total number of retries to allow, Defaults to 15.
         backoff_factor (float, optional):
             A backoff factor to apply between attempts after the second try.
+        pool_maxsize (int, optional):
+            Number of connections kept alive per host, Defaults to 10.
 
     Returns:
         requests.Session obj.
@@ -44,7 +47,7 @@ def requests_retry_session(status_forcelist=(502, 503, 504),
         status_forcelist=status_forcelist,
         method_whitelist=frozenset(["GET", "POST", "PUT", "DELETE", "HEAD"]),
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize)
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     return session
@@ -4,14 +4,97 @@ This module contains the api endpoints.
 
 """
 from django.conf import settings
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import reverse
+from django.views.decorators.http import require_GET
 from requests.exceptions import ConnectionError
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
+from . import admission
+from .admission import Overloaded
+from .analytics import hashtag_analytics
+from .cluster import cluster_route
+from .exports import DONE, HASHTAG, USER, get_worker
+from .profiling import profile_view
 from .serializers import TweetSerializer
-from .twitter import TwitterApi, TwitterException
+from .stream import hub
+from .twitter import Tweet, TwitterApi, TwitterException
 
+ANALYTICS_FIELDS = ("date", "hashtags", "likes", "retweets")
 
+
+def parse_fields(value):
+    """Parse the comma separated ``fields`` query parameter.
+
+    Args:
+        value (str):
+            comma separated tweet fields names or None.
+
+    Returns:
+        tuple of the requested fields, all the fields if ``value`` is empty.
+
+    Raises:
+        ValueError: if one of the fields is unknown.
+
+    """
+    if not value:
+        return Tweet.FIELDS
+    fields = tuple(field.strip() for field in value.split(",") if field.strip())
+    unknown = [field for field in fields if field not in Tweet.FIELDS]
+    if unknown:
+        raise ValueError("Unknown fields: %s. Available fields: %s." % (
+            ", ".join(unknown), ", ".join(Tweet.FIELDS)))
+    return fields
+
+
+def parse_positive_int(name, value):
+    """Parse a positive integer query parameter.
+
+    Args:
+        name (str):
+            name of the query parameter.
+        value (str):
+            the query parameter value.
+
+    Returns:
+        int value.
+
+    Raises:
+        ValueError: if the value is not a positive integer.
+
+    """
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        number = 0
+    if number <= 0:
+        raise ValueError("%s must be a positive integer." % name)
+    return number
+
+
+def error_response(error):
+    """Convert an upstream error to an api response.
+
+    Args:
+        error (Exception):
+            api.twitter.TwitterException, api.admission.Overloaded or
+            requests.exceptions.ConnectionError.
+
+    Returns:
+        HttpReponse with the error message.
+
+    """
+    if isinstance(error, Overloaded):
+        return Response({"error": str(error)}, status=503,
+                        headers={"Retry-After": str(error.retry_after)})
+    if isinstance(error, TwitterException):
+        return Response({"error": str(error)}, status=error.code)
+    return Response({"error": "Failed to connect to twitter api."}, status=500)
+
+
+@cluster_route("hashtags", "hashtag")
+@profile_view
 @api_view(['GET'])
 def get_tweets_by_hashtag(request, hashtag):
     """Endpoint to Get Twitter Tweets By Hashtag.
@@ -26,24 +109,25 @@ def get_tweets_by_hashtag(request, hashtag):
         HttpReponse with a list of hashtag tweets.
 
     """
+    try:
+        fields = parse_fields(request.GET.get("fields"))
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
     try:
         api = TwitterApi.init_from_settings()
         default_limit = settings.TWITTER_DEFAULT_LIMIT
         limit = request.GET.get("limit", default_limit)
-        limit = int(limit)
-        tweets = api.get_hashtag_tweets(hashtag, limit)
-        serializer = TweetSerializer(tweets, many=True)
+        limit = min(int(limit), settings.TWITTER_MAX_LIMIT)
+        contains = request.GET.get("contains") or request.GET.get("q")
+        tweets = api.get_hashtag_tweets(hashtag, limit, fields, contains=contains)
+        serializer = TweetSerializer(tweets, many=True, fields=fields)
         return Response(serializer.data, status=200)
-    except (TwitterException, ConnectionError) as e:
-        error_data = {"error": str(e)}
-        code = 500
-        if isinstance(e, TwitterException):
-            code = e.code
-        else:
-            error_data = {"error": "Failed to connect to twitter api."}
-        return Response(error_data, status=code)
+    except (TwitterException, ConnectionError, Overloaded) as e:
+        return error_response(e)
 
 
+@cluster_route("users", "screen_name")
+@profile_view
 @api_view(['GET'])
 def get_user_timeline(request, screen_name):
     """Endpoint to Get a list of tweets that the user has on his feed.
@@ -60,17 +144,201 @@ def get_user_timeline(request, screen_name):
     """
     default_limit = settings.TWITTER_DEFAULT_LIMIT
     limit = request.GET.get("limit", default_limit)
-    limit = int(limit)
+    limit = min(int(limit), settings.TWITTER_MAX_LIMIT)
+    try:
+        fields = parse_fields(request.GET.get("fields"))
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
     try:
         api = TwitterApi.init_from_settings()
-        tweets = api.get_user_timeline(screen_name, limit)
-        serializer = TweetSerializer(tweets, many=True)
+        contains = request.GET.get("contains") or request.GET.get("q")
+        tweets = api.get_user_timeline(screen_name, limit, fields, contains=contains)
+        serializer = TweetSerializer(tweets, many=True, fields=fields)
         return Response(serializer.data, status=200)
-    except (TwitterException, ConnectionError) as e:
-        error_data = {"error": str(e)}
-        code = 500
-        if isinstance(e, TwitterException):
-            code = e.code
-        else:
-            error_data = {"error": "Failed to connect to twitter api."}
-        return Response(error_data, status=code)
+    except (TwitterException, ConnectionError, Overloaded) as e:
+        return error_response(e)
+
+
+@cluster_route("hashtags", "hashtag", timeout=settings.CLUSTER_ANALYTICS_FORWARD_TIMEOUT)
+@profile_view
+@api_view(['GET'])
+def get_hashtag_analytics(request, hashtag):
+    """Endpoint to Get engagement statistics of a Hashtag.
+
+    The statistics are likes/retweets percentiles, top co-occurring hashtags
+        and posting rate per hour over up to ``limit`` recent tweets.
+
+    Args:
+        request (django.http.HttpRequest):
+            django request object.
+        hashtag (str):
+            name of the hashtag.
+
+    Returns:
+        HttpReponse with the hashtag statistics.
+
+    """
+    default_limit = settings.TWITTER_ANALYTICS_DEFAULT_LIMIT
+    limit = request.GET.get("limit", default_limit)
+    limit = min(int(limit), settings.TWITTER_ANALYTICS_MAX_LIMIT)
+    try:
+        top = parse_positive_int("top", request.GET.get("top", 10))
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    try:
+        api = TwitterApi.init_from_settings()
+        tweets = api.get_hashtag_tweets(hashtag, limit, ANALYTICS_FIELDS, admission.BATCH)
+        return Response(hashtag_analytics(tweets, hashtag, top), status=200)
+    except (TwitterException, ConnectionError, Overloaded) as e:
+        return error_response(e)
+
+
+@api_view(['GET'])
+def get_metrics(request):
+    """Endpoint to Get the admission control metrics of this process.
+
+    Args:
+        request (django.http.HttpRequest):
+            django request object.
+
+    Returns:
+        HttpReponse with the twitter api calls queue depth, in flight and shed counts.
+
+    """
+    return Response({"admission": admission.controller.metrics()}, status=200)
+
+
+@require_GET
+def stream_hashtag(request, hashtag):
+    """Endpoint to stream the new tweets of a Hashtag as Server-Sent Events.
+
+    All the clients of the same hashtag share a single upstream poller,
+        a client which doesn't consume its events fast enough is disconnected.
+
+    Args:
+        request (django.http.HttpRequest):
+            django request object.
+        hashtag (str):
+            name of the hashtag.
+
+    Returns:
+        StreamingHttpResponse of ``text/event-stream`` events.
+
+    """
+    try:
+        subscriber = hub.subscribe(hashtag)
+    except Overloaded as e:
+        response = JsonResponse({"error": str(e)}, status=503)
+        response["Retry-After"] = str(e.retry_after)
+        return response
+
+    def events():
+        try:
+            yield "retry: %d\n\n" % (settings.TWITTER_STREAM_POLL_INTERVAL * 1000)
+            while not subscriber.dropped:
+                event = subscriber.get(timeout=settings.TWITTER_STREAM_KEEPALIVE)
+                yield ": keep-alive\n\n" if event is None else event
+        finally:
+            hub.unsubscribe(hashtag, subscriber)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def export_data(request, job):
+    """Convert an export job to an api response data.
+
+    Args:
+        request (django.http.HttpRequest):
+            django request object.
+        job (api.exports.ExportJob):
+            the export job.
+
+    Returns:
+        dict of the job state with the progress and the download url when done.
+
+    """
+    data = job.to_dict()
+    data.pop("output_size")
+    data["progress"] = job.exported / job.limit if job.limit else 1
+    data["url"] = request.build_absolute_uri(reverse("export", kwargs={"job_id": job.id}))
+    data["download"] = None
+    if job.status == DONE:
+        data["download"] = request.build_absolute_uri(reverse("export-download", kwargs={"job_id": job.id}))
+    return data
+
+
+@api_view(['POST'])
+def create_export(request):
+    """Endpoint to enqueue an export job of a Hashtag or a user timeline tweets.
+
+    The request body is ``{"hashtag": <hashtag>}`` or ``{"screen_name": <screen_name>}``
+        with an optional ``limit``.
+
+    Args:
+        request (django.http.HttpRequest):
+            django request object.
+
+    Returns:
+        HttpReponse with the created job.
+
+    """
+    hashtag = request.data.get("hashtag")
+    screen_name = request.data.get("screen_name")
+    if bool(hashtag) == bool(screen_name):
+        return Response({"error": "One of hashtag or screen_name is required."}, status=400)
+    try:
+        limit = int(request.data.get("limit", settings.EXPORT_DEFAULT_LIMIT))
+    except (TypeError, ValueError):
+        return Response({"error": "limit must be an integer."}, status=400)
+    if not 0 < limit <= settings.EXPORT_MAX_LIMIT:
+        return Response({"error": "limit must be between 1 and %d." % settings.EXPORT_MAX_LIMIT}, status=400)
+    if hashtag:
+        job = get_worker().submit(HASHTAG, hashtag, limit)
+    else:
+        job = get_worker().submit(USER, screen_name, limit)
+    data = export_data(request, job)
+    return Response(data, status=202, headers={"Location": data["url"]})
+
+
+@api_view(['GET'])
+def get_export(request, job_id):
+    """Endpoint to Get the progress of an export job.
+
+    Args:
+        request (django.http.HttpRequest):
+            django request object.
+        job_id (uuid.UUID):
+            the export job id.
+
+    Returns:
+        HttpReponse with the job state.
+
+    """
+    job = get_worker().get_job(job_id)
+    if job is None:
+        return Response({"error": "Export not found."}, status=404)
+    return Response(export_data(request, job), status=200)
+
+
+@require_GET
+def download_export(request, job_id):
+    """Endpoint to download the gzip compressed NDJSON file of a finished export job.
+
+    Args:
+        request (django.http.HttpRequest):
+            django request object.
+        job_id (uuid.UUID):
+            the export job id.
+
+    Returns:
+        FileResponse of the export file.
+
+    """
+    job = get_worker().get_job(job_id)
+    if job is None or job.status != DONE:
+        return JsonResponse({"error": "Export not found or not finished yet."}, status=404)
+    return FileResponse(open(job.output_path, "rb"), as_attachment=True,
+                        filename="%s.ndjson.gz" % job.id, content_type="application/gzip")
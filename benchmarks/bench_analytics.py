@@ -0,0 +1,65 @@
+"""Hashtag analytics benchmark.
+
+Measure the time needed to build the columnar arrays and compute the
+    hashtag statistics over 10k tweets.
+
+    Usage:
+        python benchmarks/bench_analytics.py [<number_of_tweets>]
+
+"""
+import os
+import random
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "twitter_task.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from api.analytics import TweetColumns, hashtag_analytics  # noqa: E402
+from api.twitter import Tweet  # noqa: E402
+
+HASHTAGS = ["nyc", "tokyo", "python", "django", "music", "news", "travel", "food"]
+
+
+def make_tweets(count, seed=0):
+    """Build ``count`` random api.twitter.Tweet objects."""
+    rnd = random.Random(seed)
+    now = int(time.time())
+    tweets = []
+    for tweet_id in range(count, 0, -1):
+        tags = ["nyc"] + rnd.sample(HASHTAGS[1:], rnd.randint(0, 3))
+        tweets.append(Tweet({
+            "id": tweet_id,
+            "created_at": time.strftime("%a %b %d %H:%M:%S +0000 %Y",
+                                        time.gmtime(now - rnd.randint(0, 72 * 3600))),
+            "entities": {"hashtags": [{"text": tag} for tag in tags]},
+            "user": {"name": "AnyMind Group", "screen_name": "AnyMindGroup", "id": 1},
+            "favorite_count": int(rnd.paretovariate(1.5)),
+            "retweet_count": int(rnd.paretovariate(2)),
+            "text": "benchmark tweet",
+        }))
+    return tweets
+
+
+def bench(label, func, number):
+    """Print the average run time of ``func`` in milliseconds."""
+    seconds = timeit.timeit(func, number=number) / number
+    print("%-28s %8.3f ms" % (label, seconds * 1000))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    tweets = make_tweets(count)
+    columns = TweetColumns(tweets)
+    print("tweets: %d, hashtags: %d" % (len(columns), len(columns.hashtags)))
+    bench("columns", lambda: TweetColumns(tweets), 20)
+    bench("hashtag_analytics (total)", lambda: hashtag_analytics(tweets, "#nyc"), 20)
+
+
+if __name__ == "__main__":
+    main()
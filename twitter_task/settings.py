@@ -125,6 +125,72 @@ TWITTER_API_KEY = os.getenv("TWITTER_API_KEY", "<your_twitter_api_key>")
 TWITTER_API_SECRET = os.getenv("TWITTER_API_SECRET", "<your_twitter_api_secret_key>")
 TWITTER_API_URL = os.getenv("TWITTER_API_URL", "https://api.twitter.com/1.1")
 TWITTER_DEFAULT_LIMIT = int(os.getenv("TWITTER_DEFAULT_LIMIT", "30"))
+# maximum number of tweets of the hashtag and user timeline endpoints, bigger limits are fetched page by page
+TWITTER_MAX_LIMIT = int(os.getenv("TWITTER_MAX_LIMIT", "1000"))
+# fetched tweets are reused for this number of seconds, 0 disables the cache
+TWITTER_CACHE_TIMEOUT = float(os.getenv("TWITTER_CACHE_TIMEOUT", "60"))
+TWITTER_CACHE_MAX_ENTRIES = int(os.getenv("TWITTER_CACHE_MAX_ENTRIES", "1024"))
+# inverted index of the fetched tweets used by the contains/q filter: maximum number
+# of indexed tweets and minimum number of tweets fetched for a hashtag/user to filter over
+TWITTER_INDEX_MAX_TWEETS = int(os.getenv("TWITTER_INDEX_MAX_TWEETS", "50000"))
+TWITTER_INDEX_WINDOW = int(os.getenv("TWITTER_INDEX_WINDOW", "200"))
+# number of tweets the hashtag analytics endpoint is computed over
+TWITTER_ANALYTICS_DEFAULT_LIMIT = int(os.getenv("TWITTER_ANALYTICS_DEFAULT_LIMIT", "1000"))
+TWITTER_ANALYTICS_MAX_LIMIT = int(os.getenv("TWITTER_ANALYTICS_MAX_LIMIT", "5000"))
+# hashtag live stream: seconds between two polls of the same hashtag,
+# events buffered per client before dropping it and seconds between keep-alive comments
+TWITTER_STREAM_POLL_INTERVAL = float(os.getenv("TWITTER_STREAM_POLL_INTERVAL", "10"))
+TWITTER_STREAM_BUFFER_SIZE = int(os.getenv("TWITTER_STREAM_BUFFER_SIZE", "100"))
+TWITTER_STREAM_KEEPALIVE = float(os.getenv("TWITTER_STREAM_KEEPALIVE", "15"))
+# hashtags polled at the same time per process, each poller makes 900 / TWITTER_STREAM_POLL_INTERVAL
+# search calls per 15 minutes out of the 450 allowed to the app
+TWITTER_STREAM_MAX_HASHTAGS = int(os.getenv("TWITTER_STREAM_MAX_HASHTAGS", "2"))
+# admission control of twitter api calls: concurrent calls, waiting calls,
+# seconds a call may wait for a slot and Retry-After seconds sent when a call is shed
+TWITTER_MAX_CONCURRENCY = int(os.getenv("TWITTER_MAX_CONCURRENCY", "8"))
+TWITTER_MAX_QUEUE = int(os.getenv("TWITTER_MAX_QUEUE", "32"))
+TWITTER_QUEUE_TIMEOUT = float(os.getenv("TWITTER_QUEUE_TIMEOUT", "2"))
+TWITTER_RETRY_AFTER = int(os.getenv("TWITTER_RETRY_AFTER", "1"))
+
+# Export Settings
+# directory of the export jobs state and gzip compressed NDJSON files
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(BASE_DIR, "exports"))
+EXPORT_DEFAULT_LIMIT = int(os.getenv("EXPORT_DEFAULT_LIMIT", "10000"))
+EXPORT_MAX_LIMIT = int(os.getenv("EXPORT_MAX_LIMIT", "100000"))
+# twitter api calls all the exports of the app may use per window of seconds, keep it under the
+# twitter rate limit (450 search calls per 15 minutes) to leave room for the other endpoints
+EXPORT_RATE_LIMIT = int(os.getenv("EXPORT_RATE_LIMIT", "180"))
+EXPORT_RATE_LIMIT_WINDOW = float(os.getenv("EXPORT_RATE_LIMIT_WINDOW", "900"))
+# number of processes (on all the nodes) running export workers with the same twitter app,
+# each worker gets EXPORT_RATE_LIMIT / EXPORT_WORKERS calls per window
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "1"))
+# seconds to wait before retrying a rate limited or failed call
+EXPORT_RETRY_DELAY = float(os.getenv("EXPORT_RETRY_DELAY", "60"))
+# seconds between two scans for the jobs interrupted or left by a dead process
+EXPORT_RESUME_INTERVAL = float(os.getenv("EXPORT_RESUME_INTERVAL", "60"))
+
+# Cluster Settings
+# comma separated base urls of all the nodes (e.g. "http://10.0.0.1:8000,http://10.0.0.2:8000")
+# and the base url of this node, cluster mode is disabled if they are not set
+CLUSTER_NODES = [node.strip() for node in os.getenv("CLUSTER_NODES", "").split(",") if node.strip()]
+CLUSTER_SELF = os.getenv("CLUSTER_SELF", "")
+CLUSTER_FORWARD_TIMEOUT = float(os.getenv("CLUSTER_FORWARD_TIMEOUT", "10"))
+# analytics fetch up to TWITTER_ANALYTICS_MAX_LIMIT tweets, they are given more time
+CLUSTER_ANALYTICS_FORWARD_TIMEOUT = float(os.getenv("CLUSTER_ANALYTICS_FORWARD_TIMEOUT", "60"))
+# seconds an unreachable node is removed from the ring
+CLUSTER_DOWN_PERIOD = float(os.getenv("CLUSTER_DOWN_PERIOD", "30"))
+CLUSTER_POOL_SIZE = int(os.getenv("CLUSTER_POOL_SIZE", "50"))
+
+# Profiling Settings
+# requests with the header "X-Profile: <PROFILING_TOKEN>" are profiled, an empty token disables the header
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+# fraction of the requests profiled at random, 0 disables sampling
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", os.path.join(BASE_DIR, "profiles"))
+# number of functions in the hot functions summary
+PROFILING_TOP = int(os.getenv("PROFILING_TOP", "30"))
+# number of profiles kept in PROFILING_DIR, the oldest are deleted, 0 keeps all the profiles
+PROFILING_MAX_PROFILES = int(os.getenv("PROFILING_MAX_PROFILES", "100"))
 
 
 # django rest config
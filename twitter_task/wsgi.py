@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'twitter_task.settings')
 
 application = get_wsgi_application()
+
+# start the export worker with the server so the interrupted export jobs resume right away
+from api.exports import get_worker  # noqa: E402
+
+get_worker()